@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Database migration for copy-on-write forks:
+1. Add fork_sequence column to threads table
+2. Convert existing forks, whose parent messages were copied into the fork,
+   into copy-on-write forks by dropping the copies and setting fork_sequence
+
+A fork is only converted when none of its copied messages is referenced as
+the branch point of another thread. Safe to run multiple times.
+"""
+
+import sqlite3
+import os
+
+DB_PATH = 'thought_partner.db'
+
+def main():
+    if not os.path.exists(DB_PATH):
+        print(f"Database {DB_PATH} not found. Column will be created with the tables.")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(threads)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        if 'fork_sequence' not in columns:
+            print("Adding 'fork_sequence' column to threads table...")
+            cursor.execute("ALTER TABLE threads ADD COLUMN fork_sequence INTEGER")
+            conn.commit()
+        else:
+            print("Column 'fork_sequence' already exists in threads table.")
+
+        # Existing forks still hold copies of their parent's messages
+        cursor.execute("""
+            SELECT t.id, m.sequence
+            FROM threads t
+            JOIN messages m ON m.id = t.branch_from_message_id
+            WHERE t.thread_type = 'FORK' AND t.fork_sequence IS NULL
+        """)
+        legacy_forks = cursor.fetchall()
+        print(f"Found {len(legacy_forks)} forks with copied messages.")
+
+        converted = 0
+        removed = 0
+        for fork_id, fork_sequence in legacy_forks:
+            cursor.execute("""
+                SELECT COUNT(*) FROM threads
+                WHERE branch_from_message_id IN (
+                    SELECT id FROM messages WHERE thread_id = ? AND sequence <= ?
+                )
+            """, (fork_id, fork_sequence))
+            if cursor.fetchone()[0]:
+                print(f"  - Skipping fork {fork_id}: copied messages are branch points")
+                continue
+
+            cursor.execute(
+                "DELETE FROM messages WHERE thread_id = ? AND sequence <= ?",
+                (fork_id, fork_sequence)
+            )
+            removed += cursor.rowcount
+            cursor.execute(
+                "UPDATE threads SET fork_sequence = ? WHERE id = ?",
+                (fork_sequence, fork_id)
+            )
+            converted += 1
+        conn.commit()
+
+        print(f"Converted {converted} forks, removed {removed} copied messages.")
+        print("\nMigration completed successfully!")
+
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
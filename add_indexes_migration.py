@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Database migration to add indexes for the hot query shapes:
+1. Messages by thread ordered by sequence (unique per thread)
+2. Messages by thread and role ordered by sequence
+3. Threads by parent / depth / type ordered by created_at
+
+Safe to run multiple times.
+"""
+
+import sqlite3
+import os
+
+DB_PATH = 'thought_partner.db'
+
+INDEXES = [
+    ("ix_threads_parent_created",
+     "CREATE INDEX IF NOT EXISTS ix_threads_parent_created ON threads (parent_thread_id, created_at)"),
+    ("ix_threads_parent_branch_message",
+     "CREATE INDEX IF NOT EXISTS ix_threads_parent_branch_message ON threads (parent_thread_id, branch_from_message_id)"),
+    ("ix_threads_depth_created",
+     "CREATE INDEX IF NOT EXISTS ix_threads_depth_created ON threads (depth, created_at)"),
+    ("ix_threads_type_created",
+     "CREATE INDEX IF NOT EXISTS ix_threads_type_created ON threads (thread_type, created_at)"),
+    ("ix_threads_created",
+     "CREATE INDEX IF NOT EXISTS ix_threads_created ON threads (created_at)"),
+    ("ix_messages_thread_role_sequence",
+     "CREATE INDEX IF NOT EXISTS ix_messages_thread_role_sequence ON messages (thread_id, role, sequence)"),
+]
+
+UNIQUE_SEQUENCE_INDEX = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_messages_thread_sequence ON messages (thread_id, sequence)"
+)
+
+def main():
+    if not os.path.exists(DB_PATH):
+        print(f"Database {DB_PATH} not found. Indexes will be created with the tables.")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        for name, ddl in INDEXES:
+            print(f"Creating index '{name}'...")
+            cursor.execute(ddl)
+        conn.commit()
+
+        # The unique index fails on existing duplicates, so report them instead
+        cursor.execute("""
+            SELECT thread_id, sequence, COUNT(*)
+            FROM messages
+            GROUP BY thread_id, sequence
+            HAVING COUNT(*) > 1
+        """)
+        duplicates = cursor.fetchall()
+
+        if duplicates:
+            print(f"Found {len(duplicates)} duplicate (thread_id, sequence) pairs; "
+                  "skipping 'uq_messages_thread_sequence':")
+            for thread_id, sequence, count in duplicates[:20]:
+                print(f"  - thread {thread_id}, sequence {sequence}: {count} rows")
+        else:
+            print("Creating unique index 'uq_messages_thread_sequence'...")
+            cursor.execute(UNIQUE_SEQUENCE_INDEX)
+            conn.commit()
+
+        print("Updating query planner statistics...")
+        cursor.execute("ANALYZE")
+        conn.commit()
+
+        print("\nMigration completed successfully!")
+
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Database migration for background job leases:
+1. Add owner and heartbeat_at columns to llm_jobs table
+
+Jobs left without a heartbeat are taken over by the next process to start.
+Safe to run multiple times.
+"""
+
+import sqlite3
+import os
+
+DB_PATH = 'thought_partner.db'
+
+def main():
+    if not os.path.exists(DB_PATH):
+        print(f"Database {DB_PATH} not found. Columns will be created with the tables.")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(llm_jobs)")
+        columns = [column[1] for column in cursor.fetchall()]
+        if not columns:
+            print("Table llm_jobs not found. Columns will be created with the table.")
+            return
+
+        for column, column_type in (("owner", "VARCHAR"), ("heartbeat_at", "DATETIME")):
+            if column not in columns:
+                print(f"Adding '{column}' column to llm_jobs table...")
+                cursor.execute(f"ALTER TABLE llm_jobs ADD COLUMN {column} {column_type}")
+            else:
+                print(f"Column '{column}' already exists in llm_jobs table.")
+        conn.commit()
+
+        print("\nMigration completed successfully!")
+
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Database migration to add the materialized thread path:
+1. Add root_id and path columns to threads table
+2. Backfill them for existing threads from parent_thread_id links
+3. Add the (root_id, path) index used by GET /threads/{id}/tree
+
+Safe to run multiple times.
+"""
+
+import sqlite3
+import os
+
+DB_PATH = 'thought_partner.db'
+
+def main():
+    if not os.path.exists(DB_PATH):
+        print(f"Database {DB_PATH} not found. Columns will be created with the tables.")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(threads)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        for column in ('root_id', 'path'):
+            if column not in columns:
+                print(f"Adding '{column}' column to threads table...")
+                cursor.execute(f"ALTER TABLE threads ADD COLUMN {column} TEXT")
+        conn.commit()
+
+        print("Backfilling root_id and path...")
+        cursor.execute("DROP TABLE IF EXISTS temp.thread_lineage")
+        cursor.execute("""
+            CREATE TEMP TABLE thread_lineage AS
+            WITH RECURSIVE lineage(id, root_id, path) AS (
+                SELECT id, id, id FROM threads WHERE parent_thread_id IS NULL
+                UNION ALL
+                SELECT t.id, l.root_id, l.path || '/' || t.id
+                FROM threads t
+                JOIN lineage l ON t.parent_thread_id = l.id
+            )
+            SELECT id, root_id, path FROM lineage
+        """)
+        cursor.execute("CREATE UNIQUE INDEX temp.ix_thread_lineage_id ON thread_lineage (id)")
+        cursor.execute("""
+            UPDATE threads
+            SET root_id = (SELECT root_id FROM thread_lineage WHERE thread_lineage.id = threads.id),
+                path = (SELECT path FROM thread_lineage WHERE thread_lineage.id = threads.id)
+            WHERE root_id IS NULL OR path IS NULL
+        """)
+        print(f"Updated {cursor.rowcount} threads.")
+
+        print("Creating index 'ix_threads_root_path'...")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_threads_root_path ON threads (root_id, path)")
+        conn.commit()
+
+        print("\nMigration completed successfully!")
+
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
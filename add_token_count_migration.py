@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Database migration for token-budgeted context assembly:
+1. Add token_count column to messages table
+2. Backfill it for existing messages (about four characters per token,
+   the same estimate used for new messages)
+
+Safe to run multiple times.
+"""
+
+import sqlite3
+import os
+
+DB_PATH = 'thought_partner.db'
+
+def main():
+    if not os.path.exists(DB_PATH):
+        print(f"Database {DB_PATH} not found. Column will be created with the tables.")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(messages)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        if 'token_count' not in columns:
+            print("Adding 'token_count' column to messages table...")
+            cursor.execute("ALTER TABLE messages ADD COLUMN token_count INTEGER")
+            conn.commit()
+        else:
+            print("Column 'token_count' already exists in messages table.")
+
+        print("Backfilling token_count...")
+        cursor.execute("""
+            UPDATE messages
+            SET token_count = (length(content) + 3) / 4
+            WHERE token_count IS NULL
+        """)
+        print(f"Updated {cursor.rowcount} messages.")
+        conn.commit()
+
+        print("\nMigration completed successfully!")
+
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+
+from ..services.response_cache import ResponseCache
+
+router = APIRouter(prefix="/cache", tags=["cache"])
+
+
+@router.get("/stats")
+async def get_cache_stats():
+    """LLM response cache hit / miss counters since startup"""
+    return ResponseCache.stats()
+
+
+@router.delete("")
+async def clear_cache():
+    """Drop every cached LLM response"""
+    return {"deleted": await ResponseCache.clear()}
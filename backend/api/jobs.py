@@ -0,0 +1,94 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, AsyncIterator
+import asyncio
+
+from ..database import get_read_db, ReadSessionLocal
+from ..schemas import JobResponse, MessageResponse, dump_trusted
+from ..models import LLMJob, JobStatus, Message
+from ..services.job_poller import JobPoller
+from .messages import SSE_HEADERS, _sse_event
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+# Seconds between keep-alive comments on an idle event stream
+KEEPALIVE_INTERVAL = 15
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get the status of a background LLM request, with its assistant message once completed"""
+    job = await db.get(LLMJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return ORJSONResponse(await _job_payload(db, job))
+
+
+@router.get("/{job_id}/events")
+async def get_job_events(
+    job_id: str,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Follow a background LLM request as server-sent events
+    
+    Sends a `status` event on every status change, then ends with a `message`
+    event holding the persisted assistant message or an `error` event.
+    """
+    if not await db.get(LLMJob, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return StreamingResponse(
+        _stream_job_events(job_id),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+async def _job_payload(db: AsyncSession, job: LLMJob) -> Dict:
+    """Dump a job with its assistant message"""
+    payload = dump_trusted(JobResponse, job)
+    if job.message_id:
+        message = await db.get(Message, job.message_id)
+        payload["message"] = dump_trusted(MessageResponse, message) if message else None
+    return payload
+
+
+async def _stream_job_events(job_id: str) -> AsyncIterator[str]:
+    """
+    Emit job status changes until the job completes or fails
+    
+    Woken by the JobPoller on each change; the job row is re-read every
+    keep-alive interval as well, in case the change was made elsewhere.
+    """
+    last_status = None
+    while True:
+        # Watch before reading, so a change made in between is not missed
+        changed = JobPoller.watch(job_id)
+        async with ReadSessionLocal() as db:
+            job = await db.get(LLMJob, job_id)
+            if job is None:
+                yield _sse_event("error", {"detail": "Job not found"})
+                return
+            payload = await _job_payload(db, job)
+        
+        if job.status != last_status:
+            last_status = job.status
+            yield _sse_event("status", {"id": job.id, "status": job.status})
+        
+        if job.status == JobStatus.COMPLETED:
+            yield _sse_event("message", payload["message"])
+            return
+        if job.status == JobStatus.FAILED:
+            yield _sse_event("error", {"detail": job.error})
+            return
+        
+        try:
+            await asyncio.wait_for(changed.wait(), timeout=KEEPALIVE_INTERVAL)
+        except asyncio.TimeoutError:
+            yield ": keep-alive\n\n"
@@ -1,42 +1,85 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Header
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from sqlalchemy import select, delete, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Optional, AsyncIterator
+import logging
+import orjson
 
-from ..database import get_db
-from ..schemas import MessageCreate, MessageResponse, MessagesWithBranches
-from ..models import Message, MessageRole, ThreadContext, Thread, ThreadType
+from ..config import settings
+from ..database import get_db, get_read_db, SessionLocal
+from ..schemas import MessageCreate, MessageResponse, MessagesWithBranches, ThreadResponse, JobResponse, dump_trusted
+from ..models import Message, MessageRole, ThreadContext, Thread, ThreadType, LLMJob
 from ..services.thread_service import ThreadService
+from ..services.message_history import MessageHistory
 from ..services.provider_factory import ProviderFactory
+from ..services.job_poller import JobPoller
+from ..services.idempotency import IdempotencyStore, IdempotencyConflict
+from ..services.summarizer import Summarizer
+from ..services.tokens import estimate_tokens, CHARS_PER_TOKEN, MESSAGE_OVERHEAD_TOKENS
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/threads", tags=["messages"])
 
+# Overlapping sends to one thread race for the same sequences (uq_messages_thread_sequence)
+CONCURRENT_SEND_DETAIL = "Thread was modified concurrently, please retry"
+
+# Headers of server-sent event responses; identity keeps GZipMiddleware from buffering the frames
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Content-Encoding": "identity"}
+
 
 @router.get("/{thread_id}/messages")
 async def get_thread_messages(
     thread_id: str,
-    db: Session = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1, le=settings.max_page_size, description="Window size (default: whole history)"),
+    before_sequence: Optional[int] = Query(None, description="Return messages before this sequence (older)"),
+    after_sequence: Optional[int] = Query(None, description="Return messages after this sequence (newer)"),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all messages in a thread with branch information"""
+    """
+    Get messages in a thread with branch information
+    
+    With a limit and no cursor the latest messages are returned; page with the
+    first/last returned sequence. `has_more` tells whether more messages exist
+    in the paging direction.
+    """
     service = ThreadService(db)
     
+    if before_sequence is not None and after_sequence is not None:
+        raise HTTPException(status_code=400, detail="Use either 'before_sequence' or 'after_sequence', not both")
+    
     # Verify thread exists
-    thread = service.get_thread(thread_id)
+    thread = await service.get_thread(thread_id)
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
     
-    messages = service.get_messages_with_branches(thread_id)
+    messages, has_more = await service.get_messages_page(
+        thread_id,
+        limit=limit,
+        before_sequence=before_sequence,
+        after_sequence=after_sequence
+    )
     
-    return {
-        "thread_info": thread,
-        "messages": messages
-    }
+    # Rows come straight from our own tables: skip re-validating them
+    return ORJSONResponse({
+        "thread_info": dump_trusted(ThreadResponse, thread),
+        "messages": messages,
+        "has_more": has_more
+    })
 
 
-@router.post("/{thread_id}/messages", response_model=MessageResponse)
+@router.post(
+    "/{thread_id}/messages",
+    response_model=MessageResponse,
+    responses={202: {"model": JobResponse, "description": "Background request accepted"}}
+)
 async def send_message(
     thread_id: str,
     message_data: MessageCreate,
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None, max_length=255, description="Deduplicates retries of the same send"),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Send a user message and get LLM response
@@ -46,23 +89,75 @@ async def send_message(
     2. Assembles context (parent summary + thread history)
     3. Calls LLM
     4. Saves and returns assistant response
+    
+    With `stream=True` the response is a `text/event-stream` that forwards
+    `delta` events as tokens arrive and ends with a `message` event holding
+    the persisted assistant message (or an `error` event).
+    
+    With `background=True` the response is 202 with a job: follow it with
+    GET /jobs/{id} or GET /jobs/{id}/events until the assistant message is saved.
+    
+    With an `Idempotency-Key` header, repeating the same request returns the
+    original outcome (marked `Idempotent-Replayed: true`) instead of sending
+    again; duplicates arriving while it runs wait for it.
     """
     service = ThreadService(db)
     
     # Verify thread exists
-    thread = service.get_thread(thread_id)
+    thread = await service.get_thread(thread_id)
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
     
     # Get thread model for checking is_fork
-    thread_model = db.query(Thread).filter(Thread.id == thread_id).first()
+    thread_model = (await db.execute(
+        select(Thread).where(Thread.id == thread_id)
+    )).scalars().first()
     if not thread_model:
         raise HTTPException(status_code=404, detail="Thread not found")
     
-    # Get next sequence number
-    last_message = db.query(Message).filter(
-        Message.thread_id == thread_id
-    ).order_by(Message.sequence.desc()).first()
+    if idempotency_key:
+        request_hash = IdempotencyStore.fingerprint(thread_id, message_data.model_dump())
+        try:
+            outcome = await IdempotencyStore.begin(db, idempotency_key, thread_id, request_hash)
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        if outcome is not None:
+            return await _replay_response(db, outcome, message_data.stream)
+    
+    try:
+        return await _send_message(db, service, thread, thread_model, message_data, idempotency_key)
+    except BaseException:
+        if idempotency_key:
+            await IdempotencyStore.fail(idempotency_key)
+        raise
+
+
+async def _send_message(
+    db: AsyncSession,
+    service: ThreadService,
+    thread,
+    thread_model: Thread,
+    message_data: MessageCreate,
+    idempotency_key: Optional[str]
+):
+    """Save the user message, call the LLM and return the response for send_message"""
+    thread_id = thread.id
+    
+    # The next sequence is reserved for a pending background response
+    if await JobPoller.has_active_job(db, thread_id):
+        raise HTTPException(status_code=409, detail="A background response is still pending for this thread")
+    
+    # Get LLM provider
+    provider_name = message_data.provider
+    model = message_data.model
+    
+    try:
+        provider = ProviderFactory.get_provider(provider_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Get next sequence number (forks continue after their inherited prefix)
+    last_message = await service.history.get_last_message(thread)
     
     next_sequence = (last_message.sequence + 1) if last_message else 1
     
@@ -71,11 +166,17 @@ async def send_message(
         thread_id=thread_id,
         role=MessageRole.USER,
         content=message_data.content,
-        sequence=next_sequence
+        sequence=next_sequence,
+        token_count=estimate_tokens(message_data.content)
     )
     db.add(user_message)
-    db.commit()
-    db.refresh(user_message)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Another send claimed this sequence first (uq_messages_thread_sequence)
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=CONCURRENT_SEND_DETAIL)
+    await db.refresh(user_message)
     
     # Update thread title logic
     if thread_model.thread_type == ThreadType.FORK and thread.title and thread.title.startswith("Fork | "):
@@ -86,39 +187,70 @@ async def send_message(
         # For regular threads: update title on first message
         await service.update_thread_title(thread_id)
     
-    # Assemble context for LLM
-    messages_for_llm = await _assemble_llm_context(thread_id, message_data.provider, db)
-    
-    # Get previous response ID for OpenAI Responses API
+    # Get previous response ID for stateful providers (OpenAI Responses API)
     previous_response_id = None
-    if message_data.provider == "openai":
+    if provider.supports_previous_response_id:
         # First, check if there are any assistant messages in this thread
-        last_assistant_msg = db.query(Message).filter(
-            Message.thread_id == thread_id,
-            Message.role == MessageRole.ASSISTANT,
-            Message.openai_response_id.isnot(None)
-        ).order_by(Message.sequence.desc()).first()
+        # (including the prefix a fork inherits from its parent)
+        last_assistant_msg = await service.history.get_last_message(
+            thread,
+            role=MessageRole.ASSISTANT,
+            with_response_id=True
+        )
         
         if last_assistant_msg:
             # Continue from last assistant message in this thread
             previous_response_id = last_assistant_msg.openai_response_id
         elif thread.parent_thread_id and thread.branch_from_message_id:
             # This is a child thread with no messages yet - branch from parent
-            branch_from_msg = db.query(Message).filter(
-                Message.id == thread.branch_from_message_id
-            ).first()
+            branch_from_msg = (await db.execute(
+                select(Message).where(Message.id == thread.branch_from_message_id)
+            )).scalars().first()
             
             if branch_from_msg and branch_from_msg.openai_response_id:
                 previous_response_id = branch_from_msg.openai_response_id
     
-    # Get LLM provider
-    provider_name = message_data.provider
-    model = message_data.model
+    # Assemble context for LLM
+    messages_for_llm = await _assemble_llm_context(db, thread_model, previous_response_id)
     
-    try:
-        provider = ProviderFactory.get_provider(provider_name)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    if message_data.stream:
+        return StreamingResponse(
+            _stream_assistant_message(
+                thread_id,
+                next_sequence + 1,
+                provider,
+                messages_for_llm,
+                model,
+                previous_response_id,
+                idempotency_key,
+                message_data.use_cache,
+                user_message.id
+            ),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
+        )
+    
+    if message_data.background:
+        try:
+            job = await JobPoller.submit(
+                db,
+                thread_id,
+                next_sequence + 1,
+                provider,
+                messages_for_llm,
+                model=model,
+                previous_response_id=previous_response_id
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"LLM API error: {str(e)}")
+        if idempotency_key:
+            await IdempotencyStore.complete(idempotency_key, job_id=job.id)
+        
+        return ORJSONResponse(
+            dump_trusted(JobResponse, job),
+            status_code=202,
+            headers={"Location": f"/jobs/{job.id}"}
+        )
     
     # Call LLM
     try:
@@ -126,43 +258,158 @@ async def send_message(
             messages_for_llm,
             model=model,
             previous_response_id=previous_response_id,
-            background=message_data.background
+            use_cache=message_data.use_cache
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM API error: {str(e)}")
     
-    # Save assistant message
-    assistant_message = Message(
-        thread_id=thread_id,
-        role=MessageRole.ASSISTANT,
-        content=response_content,
-        sequence=next_sequence + 1,
-        model=metadata.get("model"),
-        provider=provider.provider_name,
-        tokens_used=tokens_used,
-        response_metadata=metadata,
-        openai_response_id=metadata.get("response_id")  # Store for branching
-    )
-    db.add(assistant_message)
-    db.commit()
-    db.refresh(assistant_message)
+    # Read before a rollback expires it
+    user_message_id = user_message.id
+    try:
+        assistant_message = await service.save_assistant_message(
+            thread_id, next_sequence + 1, provider.provider_name,
+            response_content, tokens_used, metadata
+        )
+    except IntegrityError:
+        # A concurrent send took the reply's sequence while the LLM was answering
+        await db.rollback()
+        await _discard_user_message(db, user_message_id)
+        raise HTTPException(status_code=409, detail=CONCURRENT_SEND_DETAIL)
+    if idempotency_key:
+        await IdempotencyStore.complete(idempotency_key, message_id=assistant_message.id)
+    return ORJSONResponse(dump_trusted(MessageResponse, assistant_message))
+
+
+async def _replay_response(db: AsyncSession, outcome: Dict, stream: bool):
+    """Answer a repeated Idempotency-Key with the original request's outcome"""
+    headers = {"Idempotent-Replayed": "true"}
+    
+    if outcome["job_id"]:
+        job = await db.get(LLMJob, outcome["job_id"])
+        if job:
+            headers["Location"] = f"/jobs/{job.id}"
+            return ORJSONResponse(dump_trusted(JobResponse, job), status_code=202, headers=headers)
+    else:
+        message = await db.get(Message, outcome["message_id"])
+        if message:
+            payload = dump_trusted(MessageResponse, message)
+            if stream:
+                async def replay() -> AsyncIterator[str]:
+                    yield _sse_event("message", payload)
+                return StreamingResponse(
+                    replay(),
+                    media_type="text/event-stream",
+                    headers={**headers, **SSE_HEADERS}
+                )
+            return ORJSONResponse(payload, headers=headers)
+    
+    raise HTTPException(status_code=410, detail="The original response for this Idempotency-Key no longer exists")
+
+
+async def _discard_user_message(db: AsyncSession, message_id: str):
+    """Remove a user message whose reply lost its sequence to a concurrent send"""
+    await db.execute(delete(Message).where(Message.id == message_id))
+    await db.commit()
+
+
+def _sse_event(event: str, data) -> str:
+    """Format a server-sent event frame"""
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+async def _stream_assistant_message(
+    thread_id: str,
+    sequence: int,
+    provider,
+    messages_for_llm: List[dict],
+    model: Optional[str],
+    previous_response_id: Optional[str],
+    idempotency_key: Optional[str] = None,
+    use_cache: Optional[bool] = True,
+    user_message_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Forward LLM deltas as SSE frames and persist the assistant message once complete
     
-    return assistant_message
+    The request-scoped session is closed before the body is streamed,
+    so the final message is saved with a session owned by the stream.
+    """
+    assistant_message = None
+    try:
+        completed = None
+        try:
+            async for event in provider.stream_message(
+                messages_for_llm,
+                model=model,
+                previous_response_id=previous_response_id,
+                use_cache=use_cache
+            ):
+                if event["type"] == "delta":
+                    yield _sse_event("delta", {"text": event["text"]})
+                elif event["type"] == "completed":
+                    completed = event
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"LLM API error: {str(e)}"})
+            return
+        
+        if completed is None:
+            yield _sse_event("error", {"detail": "LLM stream ended without a completed response"})
+            return
+        
+        try:
+            async with SessionLocal() as db:
+                try:
+                    assistant_message = await ThreadService(db).save_assistant_message(
+                        thread_id, sequence, provider.provider_name,
+                        completed["content"], completed["tokens_used"], completed["metadata"]
+                    )
+                except IntegrityError:
+                    # A concurrent send took the reply's sequence while streaming
+                    await db.rollback()
+                    if user_message_id:
+                        await _discard_user_message(db, user_message_id)
+                    yield _sse_event("error", {"detail": CONCURRENT_SEND_DETAIL})
+                    return
+        except Exception:
+            # The deltas are already sent: report the failure in the stream
+            # rather than cutting the response off
+            logger.exception(f"Failed to save streamed response for thread {thread_id}")
+            yield _sse_event("error", {"detail": "Failed to save the response"})
+            return
+        if idempotency_key:
+            await IdempotencyStore.complete(idempotency_key, message_id=assistant_message.id)
+        yield _sse_event("message", dump_trusted(MessageResponse, assistant_message))
+    finally:
+        # Failed or abandoned streams release the key for a retry
+        if idempotency_key and assistant_message is None:
+            await IdempotencyStore.fail(idempotency_key)
 
 
-async def _assemble_llm_context(thread_id: str, provider: str, db: Session) -> List[dict]:
+async def _assemble_llm_context(
+    db: AsyncSession,
+    thread: Thread,
+    previous_response_id: Optional[str]
+) -> List[dict]:
     """
     Assemble context for LLM call
     
+    With a previous_response_id the provider already holds the conversation,
+    so only the new message is loaded. Otherwise the newest messages that fit
+    in context_token_budget are sent (sized from the stored per-message token
+    estimates), preceded by the parent summary and, when summarization is
+    enabled, a summary of the older messages that did not fit.
+    
     Args:
-        thread_id: Thread ID
-        provider: Provider name (openai, anthropic, etc.)
         db: Database session
+        thread: Thread being continued
+        previous_response_id: Response the provider continues from, if any
     
     Returns:
         List of message dicts for LLM
     """
     messages = []
+    history = MessageHistory(db)
+    segments = await history.get_segments(thread)
     
     # 1. System message
     messages.append({
@@ -171,33 +418,71 @@ async def _assemble_llm_context(thread_id: str, provider: str, db: Session) -> L
                   "Provide clear, thoughtful responses that encourage further inquiry."
     })
     
-    # 2. Parent context (if exists and summarization is enabled)
-    # Note: For OpenAI Responses API with previous_response_id, the parent context
-    # is already maintained by OpenAI via previous_response_id
-    # Summaries are only needed if enable_summarization=True (for other providers)
-    from ..config import settings
+    # Stateful provider: the conversation (and the parent's) lives server-side
+    if previous_response_id:
+        tail = (await db.execute(history.build_query(segments, limit=1, from_end=True))).scalars().all()
+        return messages + [{"role": msg.role.value, "content": msg.content} for msg in tail]
     
+    budget = settings.context_token_budget - sum(
+        estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages
+    )
+    
+    # 2. Parent context (if exists and summarization is enabled)
     if settings.enable_summarization:
-        context = db.query(ThreadContext).filter(
-            ThreadContext.thread_id == thread_id
-        ).first()
+        context = (await db.execute(
+            select(ThreadContext).where(ThreadContext.thread_id == thread.id)
+        )).scalars().first()
         
         if context and context.parent_summary:
             messages.append({
                 "role": "system",
                 "content": f"Context from previous discussion:\n{context.parent_summary}"
             })
+            budget -= estimate_tokens(messages[-1]["content"]) + MESSAGE_OVERHEAD_TOKENS
+        budget -= settings.context_summary_tokens
     
-    # 3. Current thread messages
-    thread_messages = db.query(Message).filter(
-        Message.thread_id == thread_id
-    ).order_by(Message.sequence).all()
+    # 3. Current thread messages (including a fork's inherited prefix): find
+    # the oldest message that still fits, newest first, from token counts only
+    token_count = func.coalesce(
+        Message.token_count, (func.length(Message.content) + CHARS_PER_TOKEN - 1) / CHARS_PER_TOKEN
+    )
+    counts = (await db.execute(history.build_query(
+        segments,
+        limit=settings.context_max_messages,
+        from_end=True,
+        columns=[Message.sequence, token_count]
+    ))).all()
+    if not counts:
+        return messages
     
-    for msg in thread_messages:
+    cutoff = None  # Last sequence left out of the window
+    used = 0
+    for sequence, tokens in counts:
+        used += tokens + MESSAGE_OVERHEAD_TOKENS
+        if used > budget and sequence != counts[0][0]:
+            cutoff = sequence
+            break
+    else:
+        if len(counts) == settings.context_max_messages and counts[-1][0] > 1:
+            cutoff = counts[-1][0] - 1
+    
+    if cutoff is not None and settings.enable_summarization:
+        # Round up to a checkpoint so the cached prefix summary is only
+        # extended every context_summary_step messages, not on every send
+        step = settings.context_summary_step
+        cutoff = min(-(-cutoff // step) * step, counts[0][0] - 1)
+        summary, _ = await Summarizer(db).summarize_prefix(thread, cutoff)
+        if summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier part of this conversation:\n{summary}"
+            })
+    
+    window = (await db.execute(history.build_query(segments, after_sequence=cutoff))).scalars().all()
+    for msg in window:
         messages.append({
             "role": msg.role.value,
             "content": msg.content
         })
     
     return messages
-
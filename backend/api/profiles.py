@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from typing import Optional
+
+from ..config import settings
+from ..profiling import ADMIN_PREFIX, list_profiles, profile_file_path, token_matches
+
+
+async def require_profiling_token(x_profile: Optional[str] = Header(None)):
+    """Admin access: the X-Profile header must carry the profiling token"""
+    if not settings.profiling_token:
+        # Profiling is off; don't advertise the endpoints
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token_matches(x_profile):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+
+router = APIRouter(prefix=ADMIN_PREFIX, tags=["profiling"], dependencies=[Depends(require_profiling_token)])
+
+
+@router.get("")
+async def get_profiles():
+    """Stored request profiles, newest first"""
+    return list_profiles()
+
+
+@router.get("/{profile_id}/{filename}")
+async def get_profile_file(profile_id: str, filename: str):
+    """
+    One file of a stored profile: profile.speedscope.json (flame graph for
+    speedscope), allocations.txt (top allocation sites) or summary.json
+    """
+    path = profile_file_path(profile_id, filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile file not found")
+    
+    return FileResponse(path)
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
-from ..database import get_db
-from ..schemas import ThreadCreate, ThreadResponse, ThreadType
+from ..config import settings
+from ..database import get_db, get_read_db
+from ..schemas import ThreadCreate, ThreadResponse, ThreadType, ThreadTreeResponse, ThreadBreadcrumb, dump_trusted
 from ..services.thread_service import ThreadService
 
 router = APIRouter(prefix="/threads", tags=["threads"])
@@ -13,27 +15,51 @@ router = APIRouter(prefix="/threads", tags=["threads"])
 async def get_threads(
     depth: Optional[int] = Query(None, description="Filter threads by depth (e.g., 0 for root threads)"),
     types: Optional[str] = Query(None, description="Comma-separated list of thread types (root,fork,branch)"),
-    db: Session = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1, le=settings.max_page_size, description="Page size (default: all threads)"),
+    before: Optional[str] = Query(None, description="Cursor: threads older than this position"),
+    after: Optional[str] = Query(None, description="Cursor: threads newer than this position"),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all threads, optionally filtered by depth or type"""
+    """
+    Get threads newest first, optionally filtered by depth or type
+    
+    Paginated with keyset cursors: X-Before-Cursor / X-After-Cursor response
+    headers hold the cursors of the last / first thread of the page, and
+    X-Has-More tells whether more threads exist in the paging direction.
+    """
     service = ThreadService(db)
     
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+    
+    type_list = None
     if types:
         # Parse comma-separated types
         type_list = [ThreadType(t.strip()) for t in types.split(',')]
-        threads = service.get_threads_by_types(type_list)
-    elif depth is not None:
-        threads = service.get_threads_by_depth(depth)
-    else:
-        threads = service.get_threads_by_depth(None)
     
-    return threads
+    try:
+        threads, has_more = await service.get_threads_page(
+            depth=depth if not type_list else None,
+            types=type_list,
+            limit=limit,
+            before=before,
+            after=after
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    headers = {"X-Has-More": "true" if has_more else "false"}
+    if threads:
+        headers["X-Before-Cursor"] = service.encode_thread_cursor(threads[-1])
+        headers["X-After-Cursor"] = service.encode_thread_cursor(threads[0])
+    
+    return ORJSONResponse([dump_trusted(ThreadResponse, t) for t in threads], headers=headers)
 
 
 @router.post("", response_model=ThreadResponse, status_code=201)
 async def create_thread(
     thread_data: ThreadCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new thread (root or branch)"""
     service = ThreadService(db)
@@ -47,7 +73,7 @@ async def create_thread(
             branch_text_end_offset=thread_data.branch_text_end_offset,
             is_fork=thread_data.is_fork if thread_data.is_fork is not None else False
         )
-        return thread
+        return ORJSONResponse(dump_trusted(ThreadResponse, thread), status_code=201)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -55,74 +81,71 @@ async def create_thread(
 @router.get("/{thread_id}", response_model=ThreadResponse)
 async def get_thread(
     thread_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get thread metadata"""
     service = ThreadService(db)
-    thread = service.get_thread(thread_id)
+    thread = await service.get_thread(thread_id)
     
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
     
-    return thread
+    return ORJSONResponse(dump_trusted(ThreadResponse, thread))
 
 
 @router.get("/{thread_id}/children", response_model=List[ThreadResponse])
 async def get_thread_children(
     thread_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get all child threads of a thread"""
     service = ThreadService(db)
     
     # Verify parent thread exists
-    thread = service.get_thread(thread_id)
+    thread = await service.get_thread(thread_id)
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
     
-    children = service.get_children(thread_id)
-    return children
+    children = await service.get_children(thread_id)
+    return ORJSONResponse([dump_trusted(ThreadResponse, t) for t in children])
+
+
+@router.get("/{thread_id}/tree", response_model=ThreadTreeResponse)
+async def get_thread_tree(
+    thread_id: str,
+    max_depth: Optional[int] = Query(None, ge=0, description="Levels below this thread to include (default: all)"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get the nested tree of threads below a thread, with ancestor breadcrumbs"""
+    service = ThreadService(db)
+    
+    thread = await service.get_thread(thread_id)
+    if not thread:
+        raise HTTPException(status_code=404, detail="Thread not found")
+    
+    return ORJSONResponse({
+        "ancestors": [dump_trusted(ThreadBreadcrumb, t) for t in await service.get_ancestors(thread)],
+        "tree": await service.get_tree(thread, max_depth=max_depth)
+    })
 
 
 @router.delete("/{thread_id}")
 async def delete_thread(
     thread_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete a thread, all its messages, and all child branches (cascade delete)"""
-    from ..models import Thread, Message, ThreadContext
+    service = ThreadService(db)
     
     # Verify thread exists
-    thread = db.query(Thread).filter(Thread.id == thread_id).first()
+    thread = await service.get_thread(thread_id)
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
     
-    # Recursively delete all child branches
-    def delete_branch_and_children(thread_id_to_delete):
-        # Get all child threads
-        child_threads = db.query(Thread).filter(
-            Thread.parent_thread_id == thread_id_to_delete
-        ).all()
-        
-        # Recursively delete each child branch
-        for child_thread in child_threads:
-            delete_branch_and_children(child_thread.id)
-        
-        # Delete all messages in this thread
-        db.query(Message).filter(Message.thread_id == thread_id_to_delete).delete()
-        
-        # Delete thread context
-        db.query(ThreadContext).filter(ThreadContext.thread_id == thread_id_to_delete).delete()
-        
-        # Delete the thread itself
-        thread_to_delete = db.query(Thread).filter(Thread.id == thread_id_to_delete).first()
-        if thread_to_delete:
-            db.delete(thread_to_delete)
-    
     # Delete the thread and all its children
-    delete_branch_and_children(thread_id)
+    deleted = await service.delete_thread_tree(thread_id)
     
-    db.commit()
-    
-    return {"message": "Thread and all child branches deleted successfully"}
-
+    return {
+        "message": "Thread and all child branches deleted successfully",
+        "deleted": deleted
+    }
@@ -0,0 +1,84 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, List
+from datetime import date
+
+from ..database import get_read_db
+from ..schemas import UsageResponse
+from ..services.thread_service import ThreadService
+from ..services.usage import UsageRollup
+
+router = APIRouter(prefix="/usage", tags=["usage"])
+
+
+@router.get("/threads/{thread_id}", response_model=UsageResponse)
+async def get_thread_usage(
+    thread_id: str,
+    since: Optional[date] = Query(None, description="Include daily totals from this day"),
+    until: Optional[date] = Query(None, description="Include daily totals up to this day"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Token usage of one thread (its own messages and summaries)"""
+    return await _get_usage(db, "thread", thread_id, since, until)
+
+
+@router.get("/trees/{thread_id}", response_model=UsageResponse)
+async def get_tree_usage(
+    thread_id: str,
+    since: Optional[date] = Query(None, description="Include daily totals from this day"),
+    until: Optional[date] = Query(None, description="Include daily totals up to this day"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Token usage of the whole conversation tree a thread belongs to"""
+    thread = await ThreadService(db).get_thread(thread_id)
+    if not thread:
+        raise HTTPException(status_code=404, detail="Thread not found")
+    
+    return await _get_usage(db, "tree", thread.root_id or thread.id, since, until)
+
+
+@router.get("/models")
+async def get_model_usage(db: AsyncSession = Depends(get_read_db)) -> List[dict]:
+    """All-time token usage per provider/model"""
+    return await UsageRollup(db).get_keys("model")
+
+
+@router.get("/models/{provider}/{model}", response_model=UsageResponse)
+async def get_single_model_usage(
+    provider: str,
+    model: str,
+    since: Optional[date] = Query(None, description="Include daily totals from this day"),
+    until: Optional[date] = Query(None, description="Include daily totals up to this day"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Token usage of one provider/model"""
+    return await _get_usage(db, "model", UsageRollup.model_key(provider, model), since, until)
+
+
+@router.get("/daily", response_model=UsageResponse)
+async def get_daily_usage(
+    since: Optional[date] = Query(None, description="First day (default: all)"),
+    until: Optional[date] = Query(None, description="Last day (default: all)"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Overall token usage per day"""
+    usage = await _get_usage(db, "total", "all", None, None)
+    usage["days"] = await UsageRollup(db).get_days("total", "all", since, until)
+    return usage
+
+
+async def _get_usage(
+    db: AsyncSession,
+    scope: str,
+    key: str,
+    since: Optional[date],
+    until: Optional[date]
+) -> dict:
+    """All-time totals of a rollup, with daily totals when a range is given"""
+    rollup = UsageRollup(db)
+    return {
+        "scope": scope,
+        "key": key,
+        "total": await rollup.get_total(scope, key),
+        "days": await rollup.get_days(scope, key, since, until) if since or until else []
+    }
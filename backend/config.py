@@ -6,10 +6,16 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     # LLM Provider API Keys
     openai_api_key: Optional[str] = None
+    anthropic_api_key: Optional[str] = None
     
     # Default provider and model
     default_provider: str = "openai"
     default_openai_model: str = "gpt-4"
+    default_anthropic_model: str = "claude-3-5-sonnet-20241022"
+    # Anthropic requires an output limit on every request
+    anthropic_max_tokens: int = 4096
+    # Prompt-cache breakpoints on the system prompt, summaries and thread prefix
+    anthropic_prompt_caching: bool = True
     
     # Summarization settings
     # Set to True to enable parent thread summarization for child threads
@@ -17,6 +23,96 @@ class Settings(BaseSettings):
     enable_summarization: bool = False
     summarization_provider: str = "openai"
     summarization_model: str = "gpt-4"
+    # Sibling threads summarized at the same time
+    summarization_concurrency: int = 4
+    
+    # Fake provider ("provider": "fake") for offline load tests: synthetic
+    # responses, no API calls
+    fake_latency_distribution: str = "lognormal"  # fixed, uniform or lognormal
+    fake_latency_ms: float = 800.0  # Median response time
+    fake_latency_spread: float = 0.5  # Lognormal sigma, or uniform +/- fraction of the median
+    fake_output_tokens: int = 300  # Mean response length (varies +/- 50%)
+    fake_failure_rate: float = 0.0  # Probability a call raises
+    
+    # LLM HTTP client settings (one pooled client per provider, shared process-wide)
+    llm_max_connections: int = 100
+    llm_max_keepalive_connections: int = 20
+    llm_keepalive_expiry: float = 60.0  # Seconds an idle connection is kept open
+    llm_request_timeout: float = 600.0
+    llm_http2: bool = True  # Used when the h2 package is installed
+    # Import and connect providers at startup (off: pay it on the first LLM call instead)
+    provider_warmup: bool = True
+    
+    # Background LLM jobs: poll interval grows from initial to max by the backoff factor
+    job_poll_initial_interval: float = 0.5
+    job_poll_max_interval: float = 10.0
+    job_poll_backoff: float = 1.5
+    job_poll_concurrency: int = 16
+    job_timeout: float = 900.0
+    # Each process refreshes its jobs' heartbeat; jobs not refreshed within the
+    # lease timeout (their process died) are taken over by another process
+    job_heartbeat_interval: float = 10.0
+    job_lease_timeout: float = 30.0
+    
+    # Idempotency-Key records for message sends are kept this long (seconds)
+    idempotency_key_ttl: int = 86400
+    
+    # LLM response cache (opt-in): identical requests from the same branch point
+    # are answered from memory (LRU) or the llm_response_cache table
+    llm_cache_enabled: bool = False
+    llm_cache_ttl: int = 604800  # Seconds
+    llm_cache_memory_entries: int = 1000
+    llm_cache_max_entries: int = 100000
+    
+    # Response compression for bodies above this size (bytes)
+    gzip_minimum_size: int = 1024
+    gzip_compresslevel: int = 5
+    
+    # Context for providers without server-side conversation state: the newest
+    # messages that fit the budget, plus a summary of older ones when
+    # summarization is enabled (re-summarized every context_summary_step messages)
+    context_token_budget: int = 16000
+    context_summary_tokens: int = 1000  # Reserved for that summary
+    context_summary_step: int = 10
+    context_max_messages: int = 500
+    
+    # Prometheus metrics on GET /metrics (HTTP, SQL per request, LLM calls)
+    metrics_enabled: bool = True
+    
+    # Opt-in SQL inspection (development / tests): record every statement per
+    # request and report requests over these limits, with repeated statement
+    # shapes (N+1 patterns) and the code that ran them
+    query_inspection_enabled: bool = False
+    query_inspection_max_queries: int = 25
+    query_inspection_max_seconds: float = 0.25  # Total SQL time per request
+    query_inspection_repeat_threshold: int = 5  # Same statement this often is reported as N+1
+    query_inspection_raise: bool = False  # Raise QueryBudgetExceeded instead of logging (tests)
+    
+    # On-demand profiling of single requests: send `X-Profile: <token>` (or
+    # `?profile=<token>`) to profile that request. Off while no token is set.
+    profiling_token: Optional[str] = None
+    profiling_dir: str = "./profiles"
+    profiling_interval: float = 0.001  # Seconds between samples
+    profiling_top_allocations: int = 25
+    profiling_max_profiles: int = 100  # Older profiles are deleted
+    
+    # Pagination: upper bound for the `limit` query parameter
+    max_page_size: int = 200
+    
+    # Database settings
+    database_url: str = "sqlite+aiosqlite:///./thought_partner.db"
+    # SQLite engine profile, applied as PRAGMAs on every new connection
+    # WAL lets readers run alongside the single writer
+    sqlite_journal_mode: str = "WAL"
+    # NORMAL is durable across application crashes in WAL mode (not power loss)
+    sqlite_synchronous: str = "NORMAL"
+    # Wait this long for a lock instead of failing with "database is locked"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 268435456  # 256 MiB
+    sqlite_cache_size_kib: int = 65536  # Page cache per connection
+    # Dedicated read-only connections for GET endpoints
+    db_read_pool_size: int = 8
+    db_write_pool_size: int = 2
     
     class Config:
         env_file = ".env"
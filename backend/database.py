@@ -1,28 +1,82 @@
-from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./thought_partner.db"
+from .config import settings
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+SQLALCHEMY_DATABASE_URL = settings.database_url
+
+
+def _configure_sqlite(async_engine, read_only: bool = False):
+    """Apply the SQLite engine profile to every new DBAPI connection"""
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # journal_mode is persistent and needs write access, so only the writer sets it
+        if not read_only:
+            cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_size_kib)}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+# aiosqlite defaults to NullPool (a new connection, and PRAGMA setup, per
+# session); keep connections open instead
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=settings.db_write_pool_size,
+)
+# Separate pool for GET endpoints so reads never queue behind writers
+read_engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=settings.db_read_pool_size,
+)
+
+if engine.dialect.name == "sqlite":
+    _configure_sqlite(engine)
+    _configure_sqlite(read_engine, read_only=True)
+
+# expire_on_commit=False: attributes must stay loaded after commit, since
+# lazy refreshes are not possible outside of an awaited call
+SessionLocal = async_sessionmaker(
+    bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
-def get_db():
+async def get_db():
     """Dependency for FastAPI to get database session"""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def init_db():
+async def get_read_db():
+    """Dependency for FastAPI to get a read-only database session (GET endpoints)"""
+    async with ReadSessionLocal() as db:
+        yield db
+
+
+async def init_db():
     """Initialize database tables"""
     from .models import Thread, Message, ThreadContext
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
 
+async def close_db():
+    """Dispose of both connection pools"""
+    await engine.dispose()
+    await read_engine.dispose()
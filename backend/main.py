@@ -1,25 +1,72 @@
+import time
+
+_import_started = time.perf_counter()
+
+import logging
+import sys
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from contextlib import asynccontextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from .config import settings
+from .database import init_db, close_db, engine, read_engine
+from .metrics import MetricsMiddleware, instrument_engine
+from . import query_inspection
+from .profiling import ProfilingMiddleware
+from .api import threads, messages, context, jobs, cache, usage, profiles
+from .services.provider_factory import ProviderFactory
+from .services.job_poller import JobPoller
+
+_import_ms = (time.perf_counter() - _import_started) * 1000
 
-from .database import init_db
-from .api import threads, messages, context
+logger = logging.getLogger(__name__)
+
+# Heavy optional SDKs that should only be imported on first use
+_LAZY_MODULES = ("openai", "anthropic")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Initialize database
-    init_db()
+    await init_db()
+    logger.info(
+        f"Imported backend.main in {_import_ms:.0f} ms; eagerly loaded SDKs: "
+        f"{[m for m in _LAZY_MODULES if m in sys.modules] or 'none'}"
+    )
+    # Create shared provider clients and open their connections up front.
+    # Disable to defer the provider SDK import to the first LLM call.
+    if settings.provider_warmup:
+        provider_names = [settings.default_provider]
+        if settings.enable_summarization:
+            provider_names.append(settings.summarization_provider)
+        started = time.perf_counter()
+        await ProviderFactory.warmup(provider_names)
+        logger.info(f"Provider warm-up took {(time.perf_counter() - started) * 1000:.0f} ms")
+    # Resume polling background LLM jobs left in flight
+    await JobPoller.start()
     yield
-    # Shutdown: cleanup if needed
-    pass
+    # Shutdown: stop background jobs, close provider clients and database connection pools
+    await JobPoller.shutdown()
+    await ProviderFactory.shutdown()
+    await close_db()
 
 
 app = FastAPI(
     title="Threaded Chat Thought Partner",
     description="API for branching conversation threads with LLM integration",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
+# Compress large JSON bodies (message histories); small ones are sent as-is
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=settings.gzip_minimum_size,
+    compresslevel=settings.gzip_compresslevel
 )
 
 # Configure CORS
@@ -29,12 +76,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Thread pagination cursors, the job URL of 202 responses, idempotent replays and profile IDs
+    expose_headers=[
+        "X-Before-Cursor", "X-After-Cursor", "X-Has-More", "Location", "Idempotent-Replayed", "X-Profile-Id"
+    ],
 )
 
+# Opt-in N+1 / slow query reports per request
+if settings.query_inspection_enabled:
+    query_inspection.instrument_engine(engine)
+    query_inspection.instrument_engine(read_engine)
+    app.add_middleware(query_inspection.QueryInspectionMiddleware)
+
+# Opt-in profiling of single requests (not installed without a token)
+if settings.profiling_token:
+    app.add_middleware(ProfilingMiddleware)
+
+# Request and SQL metrics; outermost, so latency includes compression
+if settings.metrics_enabled:
+    instrument_engine(engine)
+    instrument_engine(read_engine)
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(threads.router)
 app.include_router(messages.router)
 app.include_router(context.router)
+app.include_router(jobs.router)
+app.include_router(cache.router)
+app.include_router(usage.router)
+app.include_router(profiles.router)
 
 
 @app.get("/")
@@ -50,3 +121,11 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics"""
+    if not settings.metrics_enabled:
+        return Response(status_code=404)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
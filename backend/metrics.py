@@ -0,0 +1,211 @@
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Optional
+import inspect
+import time
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+
+# Requests with no matching route share one label, so scans can't blow up cardinality
+UNMATCHED_ROUTE = "unmatched"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency, until the last body byte is sent",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by response status",
+    ["method", "route", "status"],
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "http_request_db_queries",
+    "SQL statements executed per HTTP request",
+    ["method", "route"],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "http_request_db_seconds",
+    "Time spent executing SQL per HTTP request",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds",
+    "LLM call latency (whole response for streams)",
+    ["provider", "model", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens used by LLM calls",
+    ["provider", "model", "kind"],
+)
+LLM_ERRORS = Counter(
+    "llm_errors_total",
+    "Failed LLM calls",
+    ["provider", "model", "operation", "error"],
+)
+
+
+class RequestStats:
+    """SQL statements run while handling one request"""
+    
+    __slots__ = ("queries", "query_seconds")
+    
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+# Stats of the request being handled (None outside requests, e.g. in the job poller)
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+
+class MetricsMiddleware:
+    """
+    Record latency, status and SQL usage of every HTTP request, labelled by route template
+    
+    Plain ASGI rather than BaseHTTPMiddleware, so there is no extra task or
+    body buffering per request; SQL is counted by the engine hooks of
+    instrument_engine into the request's RequestStats.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        # endpoint function -> route path template, filled on first request per endpoint
+        self._routes: Dict[Callable, str] = {}
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+        
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request_stats.reset(token)
+            method = scope["method"]
+            route = self._route(scope)
+            HTTP_REQUEST_DURATION.labels(method, route).observe(elapsed)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            DB_QUERIES_PER_REQUEST.labels(method, route).observe(stats.queries)
+            DB_TIME_PER_REQUEST.labels(method, route).observe(stats.query_seconds)
+    
+    def _route(self, scope) -> str:
+        # The router stores the matched endpoint in the (shared) scope
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        route = self._routes.get(endpoint)
+        if route is None:
+            for candidate in scope["router"].routes:
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    route = candidate.path
+                    break
+            else:
+                route = UNMATCHED_ROUTE
+            self._routes[endpoint] = route
+        return route
+
+
+def instrument_engine(async_engine):
+    """Count statements and time spent in SQL for the current request"""
+    
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+    
+    @event.listens_for(async_engine.sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += elapsed
+    
+    @event.listens_for(async_engine.sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        # Failed statements never reach after_cursor_execute; errors raised
+        # before before_cursor_execute left nothing to pop
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+
+def observe_llm(operation: str):
+    """
+    Record latency, tokens and errors of a provider method
+    
+    Works on send_message (tokens from the returned metadata), summarize
+    (total tokens only) and stream_message (an async generator: timed until
+    its completed event).
+    """
+    def decorator(method):
+        if inspect.isasyncgenfunction(method):
+            @wraps(method)
+            async def stream_wrapper(self, *args, **kwargs):
+                model = kwargs.get("model") or getattr(self, "default_model", None) or "unknown"
+                started = time.perf_counter()
+                try:
+                    async for event_data in method(self, *args, **kwargs):
+                        if event_data["type"] == "completed":
+                            _observe_success(
+                                self.provider_name, operation, started,
+                                event_data["tokens_used"], event_data["metadata"]
+                            )
+                        yield event_data
+                except Exception as e:
+                    LLM_ERRORS.labels(self.provider_name, model, operation, type(e).__name__).inc()
+                    raise
+            return stream_wrapper
+        
+        @wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            model = kwargs.get("model") or getattr(self, "default_model", None) or "unknown"
+            started = time.perf_counter()
+            try:
+                result = await method(self, *args, **kwargs)
+            except Exception as e:
+                LLM_ERRORS.labels(self.provider_name, model, operation, type(e).__name__).inc()
+                raise
+            if operation == "summarize":
+                # Tuple of (summary, tokens_used)
+                tokens_used, metadata = result[1], {"model": model}
+            else:
+                _, tokens_used, metadata = result
+            _observe_success(self.provider_name, operation, started, tokens_used, metadata)
+            return result
+        return wrapper
+    return decorator
+
+
+def _observe_success(provider: str, operation: str, started: float, tokens_used: int, metadata: Dict):
+    model = metadata.get("model") or "unknown"
+    LLM_REQUEST_DURATION.labels(provider, model, operation).observe(time.perf_counter() - started)
+    if metadata.get("cache_hit"):
+        # Answered from the response cache: no tokens were spent
+        return
+    LLM_TOKENS.labels(provider, model, "total").inc(tokens_used or 0)
+    if metadata.get("input_tokens"):
+        LLM_TOKENS.labels(provider, model, "input").inc(metadata["input_tokens"])
+    if metadata.get("output_tokens"):
+        LLM_TOKENS.labels(provider, model, "output").inc(metadata["output_tokens"])
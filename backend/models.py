@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, Text, DateTime, ForeignKey, JSON, Enum, Boolean
+from sqlalchemy import Column, String, Integer, Text, DateTime, ForeignKey, JSON, Enum, Boolean, Index
 from sqlalchemy.orm import relationship
 import enum
 
@@ -19,6 +19,13 @@ class ThreadType(str, enum.Enum):
     BRANCH = "branch"
 
 
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    IN_PROGRESS = "in_progress"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 class Thread(Base):
     __tablename__ = "threads"
 
@@ -32,12 +39,30 @@ class Thread(Base):
     branch_context_text = Column(Text, nullable=True)
     branch_text_start_offset = Column(Integer, nullable=True)
     branch_text_end_offset = Column(Integer, nullable=True)
+    # Copy-on-write forks: parent messages up to this sequence are inherited, not copied
+    fork_sequence = Column(Integer, nullable=True)
+    # Materialized path: root thread id and "/"-joined ids from the root down to this thread
+    root_id = Column(String, nullable=True)
+    path = Column(String, nullable=True)
 
     # Relationships
     messages = relationship("Message", back_populates="thread", foreign_keys="Message.thread_id")
     context = relationship("ThreadContext", back_populates="thread", uselist=False)
     parent = relationship("Thread", remote_side=[id], foreign_keys=[parent_thread_id])
 
+    __table_args__ = (
+        # Children / siblings of a thread, ordered by creation
+        Index("ix_threads_parent_created", "parent_thread_id", "created_at"),
+        # Branches and forks of each message (joined in get_messages_page)
+        Index("ix_threads_parent_branch_message", "parent_thread_id", "branch_from_message_id"),
+        # Thread listings filtered by depth or type, newest first
+        Index("ix_threads_depth_created", "depth", "created_at"),
+        Index("ix_threads_type_created", "thread_type", "created_at"),
+        Index("ix_threads_created", "created_at"),
+        # Whole subtrees as one range scan on the path prefix
+        Index("ix_threads_root_path", "root_id", "path"),
+    )
+
 
 class Message(Base):
     __tablename__ = "messages"
@@ -53,10 +78,19 @@ class Message(Base):
     tokens_used = Column(Integer, nullable=True)
     response_metadata = Column(JSON, nullable=True)
     openai_response_id = Column(String, nullable=True)  # For Responses API branching
+    # Token estimate of content, stored at write time for context budgeting
+    token_count = Column(Integer, nullable=True)
 
     # Relationships
     thread = relationship("Thread", back_populates="messages", foreign_keys=[thread_id])
 
+    __table_args__ = (
+        # Thread history in order, "last message" lookups; one row per position
+        Index("uq_messages_thread_sequence", "thread_id", "sequence", unique=True),
+        # First/last user message (titles) and last assistant response_id lookups
+        Index("ix_messages_thread_role_sequence", "thread_id", "role", "sequence"),
+    )
+
 
 class ThreadContext(Base):
     __tablename__ = "thread_contexts"
@@ -69,3 +103,101 @@ class ThreadContext(Base):
     # Relationships
     thread = relationship("Thread", back_populates="context")
 
+
+class PrefixSummary(Base):
+    """Summary of a thread's visible history up to a sequence, reused across branches"""
+    __tablename__ = "prefix_summaries"
+
+    thread_id = Column(String, ForeignKey("threads.id"), primary_key=True)
+    up_to_sequence = Column(Integer, primary_key=True)
+    # Message at up_to_sequence when summarized: the prefix changed if it differs
+    last_message_id = Column(String, nullable=False)
+    summary = Column(Text, nullable=False)
+    tokens_used = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class LLMJob(Base):
+    """A background LLM request whose assistant message is persisted on completion"""
+    __tablename__ = "llm_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    thread_id = Column(String, ForeignKey("threads.id"), nullable=False)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=True)
+    # Sequence reserved for the assistant message
+    sequence = Column(Integer, nullable=False)
+    # Provider-side id of the background response (None when run locally)
+    response_id = Column(String, nullable=True)
+    message_id = Column(String, ForeignKey("messages.id"), nullable=True)
+    error = Column(Text, nullable=True)
+    # Process running or polling the job; it refreshes heartbeat_at while it does
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # In-flight jobs per thread (send_message) and on startup
+        Index("ix_llm_jobs_thread_status", "thread_id", "status"),
+        Index("ix_llm_jobs_status", "status"),
+    )
+
+
+class IdempotencyKey(Base):
+    """Outcome of a message send made with an Idempotency-Key header"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    thread_id = Column(String, ForeignKey("threads.id"), nullable=False)
+    # Hash of the thread and request body the key was first used with
+    request_hash = Column(String, nullable=False)
+    completed = Column(Boolean, nullable=False, default=False)
+    # What the original request returned: an assistant message or a background job
+    message_id = Column(String, ForeignKey("messages.id"), nullable=True)
+    job_id = Column(String, ForeignKey("llm_jobs.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_idempotency_keys_expires", "expires_at"),
+        Index("ix_idempotency_keys_thread", "thread_id"),
+    )
+
+
+class LLMCacheEntry(Base):
+    """A cached LLM response (second tier behind the in-memory LRU)"""
+    __tablename__ = "llm_response_cache"
+
+    key = Column(String, primary_key=True)  # sha256 of the request
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=True)
+    content = Column(Text, nullable=False)
+    tokens_used = Column(Integer, nullable=True)
+    response_metadata = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Expiry sweeps and least-recently-used eviction
+        Index("ix_llm_response_cache_expires", "expires_at"),
+        Index("ix_llm_response_cache_last_used", "last_used_at"),
+    )
+
+
+class TokenUsage(Base):
+    """Token usage totals, kept up to date as LLM calls are recorded"""
+    __tablename__ = "token_usage"
+
+    # thread (thread id), tree (root thread id), model ("provider/model") or total ("all")
+    scope = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    # YYYY-MM-DD (UTC), or "*" for the all-time total
+    day = Column(String, primary_key=True)
+    requests = Column(Integer, nullable=False, default=0)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,168 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+import asyncio
+import hmac
+import json
+import logging
+import os
+import shutil
+import time
+import tracemalloc
+import uuid
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+# Admin endpoints for stored profiles; authenticated with the same header, never profiled
+ADMIN_PREFIX = "/admin/profiles"
+
+# Files written for each profile
+SPEEDSCOPE_FILE = "profile.speedscope.json"
+ALLOCATIONS_FILE = "allocations.txt"
+SUMMARY_FILE = "summary.json"
+PROFILE_FILES = (SPEEDSCOPE_FILE, ALLOCATIONS_FILE, SUMMARY_FILE)
+
+
+def token_matches(value: Optional[str]) -> bool:
+    """Whether value is the configured profiling token (never true when profiling is off)"""
+    return bool(settings.profiling_token) and value is not None and hmac.compare_digest(
+        value.encode(), settings.profiling_token.encode()
+    )
+
+
+class ProfilingMiddleware:
+    """
+    Profile single requests that carry the profiling token
+    
+    Send `X-Profile: <token>` (or `?profile=<token>`) to run that request
+    under pyinstrument's sampling profiler with tracemalloc on. The profile
+    is written to profiling_dir and its ID returned in `X-Profile-Id`. Only
+    installed when profiling_token is set; other requests pay one header
+    lookup. One request is profiled at a time (tracemalloc is process-wide;
+    allocations of concurrent requests show up in it too).
+    """
+    
+    _active = False
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or ProfilingMiddleware._active or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+        
+        # Only loaded once a profile is actually requested
+        from pyinstrument import Profiler
+        
+        ProfilingMiddleware._active = True
+        profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        status = None
+        
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(PROFILE_ID_HEADER, profile_id.encode())]
+            await send(message)
+        
+        tracemalloc.start()
+        profiler = Profiler(interval=settings.profiling_interval, async_mode="enabled")
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            elapsed = time.perf_counter() - started
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            ProfilingMiddleware._active = False
+            
+            summary = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "duration_ms": elapsed * 1000,
+                "peak_traced_memory_bytes": peak,
+                "created_at": datetime.utcnow().isoformat(),
+            }
+            try:
+                await asyncio.to_thread(_write_profile, summary, profiler, snapshot)
+            except Exception:
+                logger.exception(f"Failed to write profile {profile_id}")
+    
+    @staticmethod
+    def _requested(scope) -> bool:
+        if scope["path"].startswith(ADMIN_PREFIX):
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return token_matches(value.decode("latin-1"))
+        if b"profile=" in scope["query_string"]:
+            values = parse_qs(scope["query_string"].decode("latin-1")).get("profile")
+            return bool(values) and token_matches(values[0])
+        return False
+
+
+def _write_profile(summary: Dict, profiler, snapshot: tracemalloc.Snapshot):
+    """Write the flame graph, top allocations and summary of one profile, then prune old ones"""
+    from pyinstrument.renderers import SpeedscopeRenderer
+    
+    directory = os.path.join(settings.profiling_dir, summary["id"])
+    os.makedirs(directory, exist_ok=True)
+    
+    # Open in https://www.speedscope.app
+    with open(os.path.join(directory, SPEEDSCOPE_FILE), "w") as f:
+        f.write(profiler.output(SpeedscopeRenderer()))
+    
+    statistics = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        # The profiler's own sample buffers
+        tracemalloc.Filter(False, "*/pyinstrument/*"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    )).statistics("lineno")
+    top = statistics[:settings.profiling_top_allocations]
+    with open(os.path.join(directory, ALLOCATIONS_FILE), "w") as f:
+        f.write(f"Top {len(top)} allocation sites still live at the end of {summary['method']} {summary['path']}\n")
+        f.write(f"Peak traced memory: {summary['peak_traced_memory_bytes'] / 1024:.1f} KiB\n\n")
+        for stat in top:
+            f.write(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {stat.traceback}\n")
+    
+    summary["allocated_bytes"] = sum(stat.size for stat in statistics)
+    with open(os.path.join(directory, SUMMARY_FILE), "w") as f:
+        json.dump(summary, f)
+    
+    for old in list_profiles()[settings.profiling_max_profiles:]:
+        shutil.rmtree(os.path.join(settings.profiling_dir, old["id"]), ignore_errors=True)
+
+
+def list_profiles() -> List[Dict]:
+    """Summaries of the stored profiles, newest first"""
+    if not os.path.isdir(settings.profiling_dir):
+        return []
+    profiles = []
+    for profile_id in os.listdir(settings.profiling_dir):
+        try:
+            with open(os.path.join(settings.profiling_dir, profile_id, SUMMARY_FILE)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            # Still being written, or not a profile
+            continue
+    return sorted(profiles, key=lambda profile: profile["id"], reverse=True)
+
+
+def profile_file_path(profile_id: str, filename: str) -> Optional[str]:
+    """Path of one file of a stored profile, or None if there is no such file"""
+    if filename not in PROFILE_FILES or profile_id.startswith(".") or os.path.basename(profile_id) != profile_id:
+        return None
+    path = os.path.join(settings.profiling_dir, profile_id, filename)
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,175 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+import os
+import re
+import sys
+import time
+
+import greenlet
+from sqlalchemy import event
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Source files of the application; frames elsewhere (SQLAlchemy, asyncio) are skipped
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT_DIR = os.path.dirname(_PACKAGE_DIR)
+
+_WHITESPACE = re.compile(r"\s+")
+# Expanded IN lists differ in length per call; they are one shape
+_PARAMETER_LIST = re.compile(r"\(\?(?:, \?)+\)")
+
+# Longest statement text shown in a report
+MAX_STATEMENT_CHARS = 200
+
+
+class QueryBudgetExceeded(Exception):
+    """A request went over the query inspection limits (raised with query_inspection_raise)"""
+
+
+class QueryLog:
+    """SQL statements executed in one request (or capture() block), with their call sites"""
+    
+    def __init__(self, label: str):
+        self.label = label
+        # (statement, seconds, call site)
+        self.statements: List[Tuple[str, float, str]] = []
+        # Tasks started during the request inherit the log; stop recording once it is reported
+        self.closed = False
+    
+    @property
+    def seconds(self) -> float:
+        return sum(seconds for _, seconds, _ in self.statements)
+    
+    def repeated(self, threshold: int) -> List[Dict]:
+        """Statement shapes executed at least threshold times, most frequent first"""
+        shapes = defaultdict(lambda: {"count": 0, "seconds": 0.0, "call_sites": defaultdict(int)})
+        for statement, seconds, call_site in self.statements:
+            shape = shapes[_PARAMETER_LIST.sub("(?, ...)", _WHITESPACE.sub(" ", statement).strip())]
+            shape["count"] += 1
+            shape["seconds"] += seconds
+            shape["call_sites"][call_site] += 1
+        return sorted(
+            ({"statement": statement, **shape} for statement, shape in shapes.items() if shape["count"] >= threshold),
+            key=lambda shape: shape["count"],
+            reverse=True
+        )
+    
+    def problems(self) -> Optional[str]:
+        """Report of the limits this log went over, or None if it stayed within them"""
+        seconds = self.seconds
+        repeated = self.repeated(settings.query_inspection_repeat_threshold)
+        if (
+            len(self.statements) <= settings.query_inspection_max_queries
+            and seconds <= settings.query_inspection_max_seconds
+            and not repeated
+        ):
+            return None
+        
+        lines = [
+            f"{self.label}: {len(self.statements)} queries in {seconds * 1000:.1f} ms "
+            f"(limits: {settings.query_inspection_max_queries} queries, "
+            f"{settings.query_inspection_max_seconds * 1000:.0f} ms)"
+        ]
+        for shape in repeated:
+            lines.append(f"  repeated {shape['count']}x ({shape['seconds'] * 1000:.1f} ms): "
+                         f"{shape['statement'][:MAX_STATEMENT_CHARS]}")
+            for call_site, count in sorted(shape["call_sites"].items(), key=lambda item: -item[1]):
+                lines.append(f"    {count}x from {call_site}")
+        if not repeated:
+            slowest = max(self.statements, key=lambda item: item[1], default=None)
+            if slowest:
+                lines.append(f"  slowest ({slowest[1] * 1000:.1f} ms) from {slowest[2]}: "
+                             f"{_WHITESPACE.sub(' ', slowest[0])[:MAX_STATEMENT_CHARS]}")
+        return "\n".join(lines)
+
+
+# Log of the request being inspected (None when not inspecting)
+current_query_log: ContextVar[Optional[QueryLog]] = ContextVar("current_query_log", default=None)
+
+
+@contextmanager
+def capture(label: str) -> Iterator[QueryLog]:
+    """
+    Record SQL statements run inside the block, then report them if over the limits
+    
+    Raises:
+        QueryBudgetExceeded: With query_inspection_raise, if the limits were exceeded
+    """
+    log = QueryLog(label)
+    token = current_query_log.set(log)
+    try:
+        yield log
+    finally:
+        log.closed = True
+        current_query_log.reset(token)
+    
+    report = log.problems()
+    if report is not None:
+        if settings.query_inspection_raise:
+            raise QueryBudgetExceeded(report)
+        logger.warning(report)
+
+
+class QueryInspectionMiddleware:
+    """Run every HTTP request inside capture(), labelled with its method and path"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        with capture(f"{scope['method']} {scope['path']}"):
+            await self.app(scope, receive, send)
+
+
+def instrument_engine(async_engine):
+    """Record statements, their duration and call site into the current QueryLog"""
+    
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        log = current_query_log.get()
+        if log is not None and not log.closed:
+            conn.info.setdefault("inspection_started", []).append((time.perf_counter(), _call_site()))
+    
+    @event.listens_for(async_engine.sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        log = current_query_log.get()
+        if log is not None and not log.closed and conn.info.get("inspection_started"):
+            started, call_site = conn.info["inspection_started"].pop()
+            log.statements.append((statement, time.perf_counter() - started, call_site))
+    
+    @event.listens_for(async_engine.sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("inspection_started"):
+            connection.info["inspection_started"].pop()
+
+
+def _call_site() -> str:
+    """
+    Innermost application frame that led to the statement
+    
+    With the asyncio extension, statements run in a greenlet whose stack
+    ends at SQLAlchemy; the awaiting application code is on the parent
+    greenlet's stack.
+    """
+    current = greenlet.getcurrent()
+    frames = [sys._getframe(2)]
+    if current.parent is not None:
+        frames.append(current.parent.gr_frame)
+    
+    for frame in frames:
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(_PACKAGE_DIR) and filename != __file__:
+                return f"{os.path.relpath(filename, _ROOT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+            frame = frame.f_back
+    return "unknown"
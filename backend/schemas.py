@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Type, Any, Dict
 from datetime import datetime
 from enum import Enum
 
@@ -16,6 +16,13 @@ class ThreadType(str, Enum):
     BRANCH = "branch"
 
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    IN_PROGRESS = "in_progress"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 class ThreadCreate(BaseModel):
     parent_thread_id: Optional[str] = None
     branch_from_message_id: Optional[str] = None
@@ -36,16 +43,39 @@ class ThreadResponse(BaseModel):
     branch_context_text: Optional[str]
     branch_text_start_offset: Optional[int] = None
     branch_text_end_offset: Optional[int] = None
+    fork_sequence: Optional[int] = None
+    root_id: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+class ThreadBreadcrumb(BaseModel):
+    id: str
+    title: Optional[str]
+    thread_type: ThreadType
+    depth: int
+
+    class Config:
+        from_attributes = True
+
+
+class ThreadTreeNode(ThreadResponse):
+    children: List["ThreadTreeNode"] = []
+
+
+class ThreadTreeResponse(BaseModel):
+    ancestors: List[ThreadBreadcrumb]  # Root first, excluding the thread itself
+    tree: ThreadTreeNode
+
+
 class MessageCreate(BaseModel):
     content: str
     provider: Optional[str] = None
     model: Optional[str] = None
     background: Optional[bool] = False
+    use_cache: Optional[bool] = True  # False bypasses the LLM response cache
+    stream: Optional[bool] = False  # Stream assistant tokens back as server-sent events
 
 
 class MessageResponse(BaseModel):
@@ -78,6 +108,40 @@ class ThreadContextResponse(BaseModel):
         from_attributes = True
 
 
+class JobResponse(BaseModel):
+    id: str
+    thread_id: str
+    status: JobStatus
+    provider: str
+    model: Optional[str]
+    sequence: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    message: Optional[MessageResponse] = None
+
+    class Config:
+        from_attributes = True
+
+
+class UsageTotals(BaseModel):
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+
+
+class UsageDay(UsageTotals):
+    day: str
+
+
+class UsageResponse(BaseModel):
+    scope: str
+    key: str
+    total: UsageTotals
+    days: List[UsageDay] = []
+
+
 class ContextRegenerateRequest(BaseModel):
     regenerate_parent: bool = True
     regenerate_siblings: bool = False
@@ -87,3 +151,16 @@ class MessagesWithBranches(BaseModel):
     messages: List[MessageResponse]
     thread_info: ThreadResponse
 
+
+def dump_trusted(schema: Type[BaseModel], obj: Any) -> Dict:
+    """
+    Dump an object's attributes for a response schema without validating them
+
+    For data read back from our own database, which already matches the
+    schema: skips Pydantic's from_attributes validation on the hot path.
+    Missing attributes fall back to the field default.
+    """
+    return {
+        name: getattr(obj, name, field.default)
+        for name, field in schema.model_fields.items()
+    }
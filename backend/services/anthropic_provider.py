@@ -0,0 +1,240 @@
+from typing import List, Dict, Optional, Tuple, AsyncIterator
+from anthropic import AsyncAnthropic
+from .llm_provider import LLMProvider, create_http_client
+from ..metrics import observe_llm
+from .response_cache import ResponseCache
+from ..config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a cached prompt prefix
+CACHE_BREAKPOINT = {"type": "ephemeral"}
+
+# Stands in for the turns summarized away when the context window starts with a reply
+CONTINUATION_PROMPT = "(Continuing the conversation above.)"
+
+
+class AnthropicProvider(LLMProvider):
+    """
+    Anthropic Messages API provider implementation
+    
+    The Messages API is stateless, so every request carries the token-budgeted
+    history assembled for the thread. Prompt-cache breakpoints on the system
+    prompt, the context summaries and the newest message let the next turn
+    reuse the whole prefix instead of paying to prefill it again.
+    """
+    
+    def __init__(self):
+        self.http_client = create_http_client()
+        self.client = AsyncAnthropic(api_key=settings.anthropic_api_key, http_client=self.http_client)
+        self.default_model = settings.default_anthropic_model
+    
+    @observe_llm("send_message")
+    async def send_message(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        previous_response_id: Optional[str] = None,
+        background: Optional[bool] = False,
+        **kwargs
+    ) -> Tuple[str, int, Dict]:
+        """Send messages to the Anthropic Messages API (use_cache=False bypasses the response cache)"""
+        # No server-side conversation state: previous_response_id is never set for this provider
+        request_params = self._build_request_params(messages, model, kwargs)
+        
+        cache_key, cached = await self._lookup_cache(request_params, kwargs.get("use_cache"))
+        if cached is not None:
+            return cached
+        
+        response = await self.client.messages.create(**request_params)
+        
+        content = "".join(block.text for block in response.content if block.type == "text")
+        tokens_used, metadata = self._build_metadata(
+            response.id, response.model, response.stop_reason, response.usage, response.usage.output_tokens
+        )
+        
+        if cache_key and content and response.stop_reason != "max_tokens":
+            await ResponseCache.put(cache_key, self.provider_name, content, tokens_used, metadata)
+        
+        return content, tokens_used, metadata
+    
+    @observe_llm("stream_message")
+    async def stream_message(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        previous_response_id: Optional[str] = None,
+        **kwargs
+    ) -> AsyncIterator[Dict]:
+        """Stream text deltas from the Anthropic Messages API"""
+        request_params = self._build_request_params(messages, model, kwargs)
+        
+        cache_key, cached = await self._lookup_cache(request_params, kwargs.get("use_cache"))
+        if cached is not None:
+            content, tokens_used, metadata = cached
+            yield {"type": "delta", "text": content}
+            yield {"type": "completed", "content": content, "tokens_used": tokens_used, "metadata": metadata}
+            return
+        
+        request_params["stream"] = True
+        stream = await self.client.messages.create(**request_params)
+        
+        content_parts = []
+        message = None
+        stop_reason = None
+        output_tokens = 0
+        async for event in stream:
+            if event.type == "message_start":
+                # Input and prompt-cache usage are only reported here
+                message = event.message
+            elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                content_parts.append(event.delta.text)
+                yield {"type": "delta", "text": event.delta.text}
+            elif event.type == "message_delta":
+                stop_reason = event.delta.stop_reason
+                output_tokens = event.usage.output_tokens
+            elif event.type == "message_stop":
+                tokens_used, metadata = self._build_metadata(
+                    message.id, message.model, stop_reason, message.usage, output_tokens
+                )
+                content = "".join(content_parts)
+                if cache_key and content and stop_reason != "max_tokens":
+                    await ResponseCache.put(cache_key, self.provider_name, content, tokens_used, metadata)
+                metadata["streamed"] = True
+                yield {
+                    "type": "completed",
+                    "content": content,
+                    "tokens_used": tokens_used,
+                    "metadata": metadata
+                }
+    
+    def _build_request_params(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str],
+        kwargs: Dict
+    ) -> Dict:
+        """
+        Build Messages API request parameters from chat-style messages
+        
+        System messages (the system prompt, then any context summaries) become
+        system blocks; the rest must alternate user / assistant starting with
+        a user turn, so consecutive turns of one role are merged. With
+        anthropic_prompt_caching, breakpoints go on the system prompt (stable
+        for every thread), the last system block (summaries change only every
+        context_summary_step messages) and the newest message, so the next
+        turn reads the whole thread prefix from the cache.
+        """
+        system_blocks = []
+        conversation = []
+        
+        for msg in messages:
+            if msg["role"] == "system":
+                system_blocks.append({"type": "text", "text": msg["content"]})
+            elif conversation and conversation[-1]["role"] == msg["role"]:
+                conversation[-1]["content"].append({"type": "text", "text": msg["content"]})
+            else:
+                conversation.append({"role": msg["role"], "content": [{"type": "text", "text": msg["content"]}]})
+        
+        if not conversation or conversation[0]["role"] != "user":
+            conversation.insert(0, {"role": "user", "content": [{"type": "text", "text": CONTINUATION_PROMPT}]})
+        
+        if settings.anthropic_prompt_caching:
+            # At most 4 breakpoints are allowed per request; this uses up to 3
+            if system_blocks:
+                system_blocks[0]["cache_control"] = CACHE_BREAKPOINT
+                system_blocks[-1]["cache_control"] = CACHE_BREAKPOINT
+            conversation[-1]["content"][-1]["cache_control"] = CACHE_BREAKPOINT
+        
+        request_params = {
+            "model": model or self.default_model,
+            "max_tokens": kwargs.get("max_tokens", settings.anthropic_max_tokens),
+            "messages": conversation,
+        }
+        
+        if system_blocks:
+            request_params["system"] = system_blocks
+        
+        if "temperature" in kwargs:
+            request_params["temperature"] = kwargs["temperature"]
+        
+        return request_params
+    
+    @staticmethod
+    def _build_metadata(
+        message_id: str,
+        model: str,
+        stop_reason: Optional[str],
+        usage,
+        output_tokens: int
+    ) -> Tuple[int, Dict]:
+        """
+        Extract token usage, including prompt-cache reads and writes, from a response
+        
+        input_tokens counts the whole prompt (uncached + cache read + cache
+        write), as it does for other providers; the cache split is reported
+        separately.
+        """
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+        input_tokens = (usage.input_tokens or 0) + cache_read + cache_write
+        
+        metadata = {
+            "model": model,
+            "status": "incomplete" if stop_reason == "max_tokens" else "completed",
+            "stop_reason": stop_reason,
+            # Not "response_id": that key is stored for previous_response_id branching
+            "anthropic_message_id": message_id,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens or 0,
+            "cache_read_input_tokens": cache_read,
+            "cache_creation_input_tokens": cache_write,
+            "background": False,
+        }
+        
+        return input_tokens + (output_tokens or 0), metadata
+    
+    @observe_llm("summarize")
+    async def summarize(
+        self,
+        text: str,
+        model: Optional[str] = None
+    ) -> Tuple[str, int]:
+        """Generate summary using Anthropic"""
+        response = await self.client.messages.create(
+            model=model or self.default_model,
+            max_tokens=settings.anthropic_max_tokens,
+            system="You are a helpful assistant that creates concise summaries of conversations. "
+                   "Capture the key points, topics discussed, and main conclusions. "
+                   "Keep the summary brief but informative.",
+            messages=[
+                {
+                    "role": "user",
+                    "content": f"Please summarize the following conversation:\n\n{text}"
+                }
+            ]
+        )
+        
+        summary = "".join(block.text for block in response.content if block.type == "text")
+        tokens_used = response.usage.input_tokens + response.usage.output_tokens
+        
+        return summary, tokens_used
+    
+    async def warmup(self):
+        """Open a pooled connection to the API so the first message skips the TLS handshake"""
+        if not settings.anthropic_api_key:
+            return
+        try:
+            # Any response will do: only the connection matters
+            await self.http_client.head(str(self.client.base_url))
+        except Exception as e:
+            logger.warning(f"Anthropic warm-up failed: {e}")
+    
+    async def aclose(self):
+        """Close the pooled HTTP client"""
+        await self.client.close()
+    
+    @property
+    def provider_name(self) -> str:
+        return "anthropic"
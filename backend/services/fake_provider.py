@@ -0,0 +1,139 @@
+from typing import List, Dict, Optional, Tuple, AsyncIterator
+import asyncio
+import random
+import uuid
+from .llm_provider import LLMProvider
+from ..metrics import observe_llm
+from .tokens import estimate_tokens
+from ..config import settings
+
+# Share of the response time spent before the first streamed chunk
+FIRST_TOKEN_FRACTION = 0.2
+
+# Streamed responses arrive in this many chunks
+STREAM_CHUNKS = 10
+
+WORDS = (
+    "the", "idea", "branch", "thread", "context", "question", "answer", "model",
+    "explore", "because", "consider", "example", "learning", "detail", "and", "so",
+)
+
+
+class FakeProvider(LLMProvider):
+    """
+    Offline provider for load tests: synthetic text, no API calls
+    
+    Responses take a random time drawn from fake_latency_distribution around
+    fake_latency_ms, contain about fake_output_tokens tokens and fail with
+    probability fake_failure_rate, so the backend can be exercised under
+    realistic LLM latency without paying for it.
+    """
+    
+    def __init__(self):
+        self.default_model = "fake-model"
+    
+    @observe_llm("send_message")
+    async def send_message(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        previous_response_id: Optional[str] = None,
+        background: Optional[bool] = False,
+        **kwargs
+    ) -> Tuple[str, int, Dict]:
+        """Wait a sampled latency, then return synthetic text"""
+        await asyncio.sleep(self._sample_latency())
+        self._maybe_fail()
+        content = self._make_text()
+        tokens_used, metadata = self._build_metadata(messages, content, model)
+        return content, tokens_used, metadata
+    
+    @observe_llm("stream_message")
+    async def stream_message(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        previous_response_id: Optional[str] = None,
+        **kwargs
+    ) -> AsyncIterator[Dict]:
+        """Stream synthetic text in chunks spread over a sampled latency"""
+        latency = self._sample_latency()
+        await asyncio.sleep(latency * FIRST_TOKEN_FRACTION)
+        self._maybe_fail()
+        
+        content = self._make_text()
+        words = content.split(" ")
+        step = max(1, len(words) // STREAM_CHUNKS)
+        for start in range(0, len(words), step):
+            if start:
+                await asyncio.sleep(latency * (1 - FIRST_TOKEN_FRACTION) / STREAM_CHUNKS)
+            chunk = " ".join(words[start:start + step])
+            yield {"type": "delta", "text": chunk if start + step >= len(words) else chunk + " "}
+        
+        tokens_used, metadata = self._build_metadata(messages, content, model)
+        metadata["streamed"] = True
+        yield {
+            "type": "completed",
+            "content": content,
+            "tokens_used": tokens_used,
+            "metadata": metadata
+        }
+    
+    @observe_llm("summarize")
+    async def summarize(
+        self,
+        text: str,
+        model: Optional[str] = None
+    ) -> Tuple[str, int]:
+        """Wait a sampled latency, then return a synthetic summary"""
+        await asyncio.sleep(self._sample_latency())
+        self._maybe_fail()
+        summary = self._make_text(settings.fake_output_tokens // 3)
+        return summary, estimate_tokens(text) + estimate_tokens(summary)
+    
+    @staticmethod
+    def _sample_latency() -> float:
+        """Response time in seconds, drawn from the configured distribution"""
+        median = settings.fake_latency_ms / 1000
+        spread = settings.fake_latency_spread
+        distribution = settings.fake_latency_distribution
+        if distribution == "fixed":
+            return median
+        if distribution == "uniform":
+            return max(0.0, random.uniform(median * (1 - spread), median * (1 + spread)))
+        if distribution == "lognormal":
+            # Long right tail, like real generation times
+            return random.lognormvariate(0, spread) * median
+        raise ValueError(f"Unknown fake_latency_distribution '{distribution}' (fixed, uniform or lognormal)")
+    
+    @staticmethod
+    def _maybe_fail():
+        if random.random() < settings.fake_failure_rate:
+            raise RuntimeError("Simulated provider failure")
+    
+    @staticmethod
+    def _make_text(tokens: Optional[int] = None) -> str:
+        """Synthetic text of about `tokens` tokens (default: fake_output_tokens ±50%)"""
+        if tokens is None:
+            mean = settings.fake_output_tokens
+            tokens = random.randint(mean // 2, mean + mean // 2)
+        # Words here average a little over one token (estimate_tokens: 4 chars)
+        return " ".join(random.choice(WORDS) for _ in range(max(1, tokens)))
+    
+    def _build_metadata(self, messages: List[Dict[str, str]], content: str, model: Optional[str]) -> Tuple[int, Dict]:
+        input_tokens = sum(estimate_tokens(msg["content"]) for msg in messages)
+        output_tokens = estimate_tokens(content)
+        metadata = {
+            "model": model or self.default_model,
+            "status": "completed",
+            # Not "response_id": the fake provider keeps no conversation state
+            "fake_response_id": f"fake_{uuid.uuid4().hex}",
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "background": False,
+        }
+        return input_tokens + output_tokens, metadata
+    
+    @property
+    def provider_name(self) -> str:
+        return "fake"
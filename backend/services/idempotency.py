@@ -0,0 +1,188 @@
+from typing import Dict, Optional, Tuple
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import hashlib
+import logging
+import time
+
+import orjson
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps of expired keys
+PURGE_INTERVAL = 3600
+
+
+class IdempotencyConflict(Exception):
+    """A key cannot be used for this request; status_code is the HTTP status to answer with"""
+    
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+
+
+class IdempotencyStore:
+    """
+    Deduplicates message sends made with an Idempotency-Key header
+    
+    The first request with a key claims it in the idempotency_keys table and
+    records what it returned (assistant message or background job) once done;
+    replays within the TTL get that outcome instead of a second LLM call.
+    Concurrent requests with the same key in this process wait on the first
+    one's future rather than polling the table.
+    """
+    
+    # key -> (future resolved with the outcome, request hash) of the in-flight request
+    _inflight: Dict[str, Tuple[asyncio.Future, str]] = {}
+    _next_purge: float = 0.0
+    
+    @staticmethod
+    def fingerprint(thread_id: str, body: Dict) -> str:
+        """Hash of the thread and request body a key is bound to"""
+        payload = orjson.dumps({"thread_id": thread_id, "body": body}, option=orjson.OPT_SORT_KEYS)
+        return hashlib.sha256(payload).hexdigest()
+    
+    @classmethod
+    async def begin(
+        cls,
+        db: AsyncSession,
+        key: str,
+        thread_id: str,
+        request_hash: str
+    ) -> Optional[Dict]:
+        """
+        Claim a key, or get the outcome of the request that already used it
+        
+        Args:
+            db: Database session
+            key: Idempotency-Key header value
+            thread_id: Thread the message is sent to
+            request_hash: fingerprint() of the request
+        
+        Returns:
+            None if the key was claimed (call complete() or fail() afterwards),
+            otherwise the original outcome as {"message_id", "job_id"}
+        
+        Raises:
+            IdempotencyConflict: If the key was used with a different request,
+                or its request is still running elsewhere or failed
+        """
+        inflight = cls._inflight.get(key)
+        if inflight is not None:
+            future, inflight_hash = inflight
+            if inflight_hash != request_hash:
+                raise IdempotencyConflict(422, "Idempotency-Key was already used with a different request")
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout=settings.llm_request_timeout)
+            except asyncio.TimeoutError:
+                raise IdempotencyConflict(409, "A request with this Idempotency-Key is still in progress")
+        
+        # Claim the key in this process before the first await, so concurrent
+        # duplicates find the future above
+        future = asyncio.get_running_loop().create_future()
+        # Waiters retrieve the exception; don't log it as never retrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        cls._inflight[key] = (future, request_hash)
+        try:
+            await cls._purge_expired(db)
+            
+            record = await db.get(IdempotencyKey, key)
+            if record is not None and record.expires_at <= datetime.utcnow():
+                await db.delete(record)
+                await db.flush()
+                record = None
+            
+            if record is None:
+                db.add(IdempotencyKey(
+                    key=key,
+                    thread_id=thread_id,
+                    request_hash=request_hash,
+                    expires_at=datetime.utcnow() + timedelta(seconds=settings.idempotency_key_ttl)
+                ))
+                await db.commit()
+                return None
+            
+            if record.request_hash != request_hash:
+                raise IdempotencyConflict(422, "Idempotency-Key was already used with a different request")
+            if not record.completed:
+                claimed_for = (datetime.utcnow() - record.created_at).total_seconds()
+                if claimed_for < settings.llm_request_timeout:
+                    raise IdempotencyConflict(409, "A request with this Idempotency-Key is still in progress")
+                # Abandoned by a crashed process or a stream that never started: take it over
+                record.created_at = datetime.utcnow()
+                record.expires_at = record.created_at + timedelta(seconds=settings.idempotency_key_ttl)
+                await db.commit()
+                return None
+            
+            outcome = {"message_id": record.message_id, "job_id": record.job_id}
+            cls._resolve(key, outcome)
+            return outcome
+        except IntegrityError:
+            # Claimed by another process between our read and insert
+            await db.rollback()
+            cls._resolve(key, error=IdempotencyConflict(409, "A request with this Idempotency-Key is still in progress"))
+            raise IdempotencyConflict(409, "A request with this Idempotency-Key is still in progress")
+        except BaseException as e:
+            cls._resolve(key, error=e if isinstance(e, IdempotencyConflict) else
+                         IdempotencyConflict(409, "The original request with this Idempotency-Key failed, retry it"))
+            raise
+    
+    @classmethod
+    async def complete(cls, key: str, message_id: Optional[str] = None, job_id: Optional[str] = None):
+        """Record the outcome of a claimed key and release waiting duplicates"""
+        async with SessionLocal() as db:
+            record = await db.get(IdempotencyKey, key)
+            if record is not None:
+                record.completed = True
+                record.message_id = message_id
+                record.job_id = job_id
+                await db.commit()
+        cls._resolve(key, {"message_id": message_id, "job_id": job_id})
+    
+    @classmethod
+    async def fail(cls, key: str):
+        """Release a claimed key after its request failed, so it can be retried"""
+        try:
+            async with SessionLocal() as db:
+                await db.execute(
+                    delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.completed.is_(False))
+                )
+                await db.commit()
+        except Exception:
+            logger.exception(f"Failed to release Idempotency-Key {key}")
+        finally:
+            cls._resolve(key, error=IdempotencyConflict(
+                409, "The original request with this Idempotency-Key failed, retry it"
+            ))
+    
+    @classmethod
+    def _resolve(cls, key: str, outcome: Optional[Dict] = None, error: Optional[BaseException] = None):
+        future, _ = cls._inflight.pop(key, (None, None))
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(outcome)
+    
+    @classmethod
+    async def _purge_expired(cls, db: AsyncSession):
+        """Delete expired keys, at most once per PURGE_INTERVAL"""
+        now = time.monotonic()
+        if now < cls._next_purge:
+            return
+        cls._next_purge = now + PURGE_INTERVAL
+        result = await db.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()),
+            execution_options={"synchronize_session": False}
+        )
+        await db.commit()
+        if result.rowcount:
+            logger.info(f"Purged {result.rowcount} expired idempotency keys")
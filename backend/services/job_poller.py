@@ -0,0 +1,409 @@
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import LLMJob, JobStatus
+from .llm_provider import LLMProvider
+from .provider_factory import ProviderFactory
+from .thread_service import ThreadService
+from .usage import UsageRollup
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = (JobStatus.QUEUED, JobStatus.IN_PROGRESS)
+
+# Consecutive failed polls (network errors, 5xx) before a job is given up
+MAX_POLL_ERRORS = 3
+
+
+class JobPoller:
+    """
+    Runs background LLM requests as jobs and persists their results
+    
+    A single poller task serves every in-flight provider-side response. Each
+    job is re-checked on its own schedule, starting at job_poll_initial_interval
+    and backing off to job_poll_max_interval, so long generations cost a few
+    requests instead of one per second. Providers without background support
+    run the request in a local task instead. Either way the assistant message
+    and the job's final status are committed together.
+    
+    Several processes (workers) can share the database. Each job is owned by
+    the process that started it, which refreshes the job's heartbeat while
+    it runs or polls it. Jobs whose heartbeat is older than job_lease_timeout
+    belong to a process that died: another process takes them over, polling
+    provider-side jobs and failing local ones.
+    """
+    
+    # Identifies this process as the owner of its jobs
+    owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    
+    # job_id -> polling state of provider-side jobs
+    _remote: Dict[str, Dict] = {}
+    # job_id -> task running a request locally
+    _local: Dict[str, asyncio.Task] = {}
+    # job_id -> event set on the job's next status change
+    _changed: Dict[str, asyncio.Event] = {}
+    _task: Optional[asyncio.Task] = None
+    _wakeup: Optional[asyncio.Event] = None
+    _heartbeat_task: Optional[asyncio.Task] = None
+    
+    @classmethod
+    async def start(cls):
+        """Take over jobs of processes that died, start polling and the heartbeat"""
+        await cls._recover()
+        cls._ensure_running()
+        cls._heartbeat_task = asyncio.create_task(cls._heartbeat())
+    
+    @classmethod
+    async def shutdown(cls):
+        """Stop polling, cancel local requests and release this process's jobs"""
+        tasks = list(cls._local.values())
+        for task in (cls._task, cls._heartbeat_task):
+            if task is not None:
+                tasks.append(task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        
+        # Expire the leases now, so another process need not wait to take the jobs over
+        try:
+            async with SessionLocal() as db:
+                await db.execute(
+                    update(LLMJob)
+                    .where(LLMJob.owner == cls.owner_id, LLMJob.status.in_(ACTIVE_STATUSES))
+                    .values(heartbeat_at=None)
+                )
+                await db.commit()
+        except Exception:
+            logger.exception("Failed to release background jobs")
+        
+        cls._remote.clear()
+        cls._local.clear()
+        cls._task = None
+        cls._wakeup = None
+        cls._heartbeat_task = None
+    
+    @classmethod
+    async def submit(
+        cls,
+        db: AsyncSession,
+        thread_id: str,
+        sequence: int,
+        provider: LLMProvider,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        previous_response_id: Optional[str] = None
+    ) -> LLMJob:
+        """
+        Start a background request for a thread's next assistant message
+        
+        Args:
+            db: Database session
+            thread_id: Thread the assistant message belongs to
+            sequence: Sequence reserved for the assistant message
+            provider: LLM provider
+            messages: Context for the LLM
+            model: Optional model override
+            previous_response_id: Optional previous response ID for stateful APIs
+        
+        Returns:
+            The persisted LLMJob
+        """
+        job = LLMJob(
+            thread_id=thread_id,
+            status=JobStatus.QUEUED,
+            provider=provider.provider_name,
+            model=model,
+            sequence=sequence,
+            owner=cls.owner_id,
+            heartbeat_at=datetime.utcnow()
+        )
+        if provider.supports_background:
+            job.response_id = await provider.start_background(
+                messages,
+                model=model,
+                previous_response_id=previous_response_id
+            )
+        db.add(job)
+        await db.commit()
+        
+        if job.response_id is not None:
+            cls._track(job)
+            cls._ensure_running()
+        else:
+            cls._local[job.id] = asyncio.create_task(
+                cls._run_local(job.id, provider, messages, model, previous_response_id)
+            )
+        return job
+    
+    @classmethod
+    async def has_active_job(cls, db: AsyncSession, thread_id: str) -> bool:
+        """Whether a thread still waits for a background assistant message"""
+        return (await db.execute(
+            select(LLMJob.id)
+            .where(LLMJob.thread_id == thread_id, LLMJob.status.in_(ACTIVE_STATUSES))
+            .limit(1)
+        )).first() is not None
+    
+    @classmethod
+    def watch(cls, job_id: str) -> asyncio.Event:
+        """Get an event that is set on the job's next status change"""
+        event = cls._changed.get(job_id)
+        if event is None:
+            event = cls._changed[job_id] = asyncio.Event()
+        return event
+    
+    @classmethod
+    def _notify(cls, job_id: str):
+        event = cls._changed.pop(job_id, None)
+        if event is not None:
+            event.set()
+    
+    @classmethod
+    def _track(cls, job: LLMJob):
+        # Jobs resumed after a restart keep their original deadline
+        elapsed = (datetime.utcnow() - job.created_at).total_seconds() if job.created_at else 0
+        now = time.monotonic()
+        cls._remote[job.id] = {
+            "provider": job.provider,
+            "response_id": job.response_id,
+            "status": job.status,
+            "interval": settings.job_poll_initial_interval,
+            "due": now + settings.job_poll_initial_interval,
+            "deadline": now + max(0.0, settings.job_timeout - elapsed),
+            "errors": 0,
+        }
+        if cls._wakeup is not None:
+            cls._wakeup.set()
+    
+    @classmethod
+    async def _heartbeat(cls):
+        """Refresh the leases of this process's jobs and take over expired ones"""
+        while True:
+            await asyncio.sleep(settings.job_heartbeat_interval)
+            try:
+                job_ids = list(cls._remote) + list(cls._local)
+                if job_ids:
+                    async with SessionLocal() as db:
+                        await db.execute(
+                            update(LLMJob)
+                            .where(LLMJob.id.in_(job_ids), LLMJob.owner == cls.owner_id)
+                            .values(heartbeat_at=datetime.utcnow())
+                        )
+                        await db.commit()
+                await cls._recover()
+            except Exception:
+                logger.exception("Background job heartbeat failed")
+    
+    @classmethod
+    async def _recover(cls):
+        """
+        Take over active jobs whose lease expired
+        
+        Each job is claimed with a compare-and-set on its heartbeat, so when
+        several processes recover at once only one of them gets it.
+        Provider-side jobs are polled from here on; local requests died with
+        the process that ran them and are failed.
+        """
+        stale = datetime.utcnow() - timedelta(seconds=settings.job_lease_timeout)
+        async with SessionLocal() as db:
+            jobs = (await db.execute(
+                select(LLMJob).where(
+                    LLMJob.status.in_(ACTIVE_STATUSES),
+                    or_(LLMJob.heartbeat_at.is_(None), LLMJob.heartbeat_at < stale)
+                )
+            )).scalars().all()
+            
+            claimed = []
+            for job in jobs:
+                if job.heartbeat_at is None:
+                    heartbeat = LLMJob.heartbeat_at.is_(None)
+                else:
+                    heartbeat = LLMJob.heartbeat_at == job.heartbeat_at
+                values = {"owner": cls.owner_id, "heartbeat_at": datetime.utcnow()}
+                if job.response_id is None:
+                    values.update(status=JobStatus.FAILED, error="Interrupted by a server restart")
+                result = await db.execute(
+                    update(LLMJob)
+                    .where(LLMJob.id == job.id, LLMJob.status.in_(ACTIVE_STATUSES), heartbeat)
+                    .values(**values)
+                )
+                if result.rowcount:
+                    claimed.append(job)
+            await db.commit()
+        
+        resumed = [job for job in claimed if job.response_id is not None]
+        for job in resumed:
+            cls._track(job)
+        for job in claimed:
+            if job.response_id is None:
+                cls._notify(job.id)
+        if claimed:
+            logger.info(f"Took over {len(resumed)} background jobs, failed {len(claimed) - len(resumed)} interrupted ones")
+    
+    @classmethod
+    def _ensure_running(cls):
+        if cls._task is None or cls._task.done():
+            cls._wakeup = asyncio.Event()
+            cls._task = asyncio.create_task(cls._run())
+    
+    @classmethod
+    async def _run(cls):
+        """Poll due jobs, then sleep until the next one is due or a job is added"""
+        semaphore = asyncio.Semaphore(settings.job_poll_concurrency)
+        
+        async def poll(job_id: str):
+            async with semaphore:
+                try:
+                    await cls._poll(job_id)
+                except Exception:
+                    logger.exception(f"Polling job {job_id} failed")
+                    await cls._finish(job_id, error="Internal error while polling the response")
+        
+        while True:
+            cls._wakeup.clear()
+            now = time.monotonic()
+            due = [job_id for job_id, job in cls._remote.items() if job["due"] <= now]
+            if due:
+                await asyncio.gather(*(poll(job_id) for job_id in due))
+                continue
+            
+            next_due = min((job["due"] for job in cls._remote.values()), default=None)
+            try:
+                await asyncio.wait_for(
+                    cls._wakeup.wait(),
+                    timeout=None if next_due is None else next_due - now
+                )
+            except asyncio.TimeoutError:
+                pass
+    
+    @classmethod
+    async def _poll(cls, job_id: str):
+        """Check one provider-side job and reschedule it or finish it"""
+        job = cls._remote[job_id]
+        try:
+            provider = ProviderFactory.get_provider(job["provider"])
+            result = await provider.retrieve_background(job["response_id"])
+        except RuntimeError as e:
+            await cls._finish(job_id, error=f"LLM API error: {str(e)}")
+            return
+        except Exception as e:
+            job["errors"] += 1
+            if job["errors"] >= MAX_POLL_ERRORS:
+                await cls._finish(job_id, error=f"LLM API error: {str(e)}")
+                return
+            logger.warning(f"Polling job {job_id} failed ({job['errors']}/{MAX_POLL_ERRORS}): {e}")
+            result = None
+        else:
+            job["errors"] = 0
+        
+        if result is not None:
+            await cls._finish(job_id, result=result)
+            return
+        
+        now = time.monotonic()
+        if now >= job["deadline"]:
+            await cls._finish(job_id, error="Background request did not complete within timeout")
+            return
+        
+        if job["status"] == JobStatus.QUEUED and job["errors"] == 0:
+            job["status"] = JobStatus.IN_PROGRESS
+            await cls._set_status(job_id, JobStatus.IN_PROGRESS)
+        
+        job["interval"] = min(job["interval"] * settings.job_poll_backoff, settings.job_poll_max_interval)
+        job["due"] = min(now + job["interval"], job["deadline"])
+    
+    @classmethod
+    async def _run_local(
+        cls,
+        job_id: str,
+        provider: LLMProvider,
+        messages: List[Dict[str, str]],
+        model: Optional[str],
+        previous_response_id: Optional[str]
+    ):
+        """Run a request for a provider without background support"""
+        try:
+            await cls._set_status(job_id, JobStatus.IN_PROGRESS)
+            try:
+                result = await asyncio.wait_for(
+                    provider.send_message(
+                        messages,
+                        model=model,
+                        previous_response_id=previous_response_id,
+                        # Background jobs are not cached, like provider-side ones
+                        use_cache=False
+                    ),
+                    timeout=settings.job_timeout
+                )
+            except asyncio.TimeoutError:
+                await cls._finish(job_id, error="Background request did not complete within timeout")
+            except Exception as e:
+                await cls._finish(job_id, error=f"LLM API error: {str(e)}")
+            else:
+                await cls._finish(job_id, result=result)
+        finally:
+            cls._local.pop(job_id, None)
+    
+    @classmethod
+    async def _set_status(cls, job_id: str, status: JobStatus):
+        async with SessionLocal() as db:
+            await db.execute(update(LLMJob).where(LLMJob.id == job_id).values(status=status))
+            await db.commit()
+        cls._notify(job_id)
+    
+    @classmethod
+    async def _finish(
+        cls,
+        job_id: str,
+        result: Optional[Tuple[str, int, Dict]] = None,
+        error: Optional[str] = None
+    ):
+        """Persist the assistant message (or the error) and the final job status"""
+        cls._remote.pop(job_id, None)
+        try:
+            async with SessionLocal() as db:
+                job = await db.get(LLMJob, job_id)
+                if job is None:
+                    # The thread was deleted while the request ran
+                    return
+                if job.owner != cls.owner_id or job.status not in ACTIVE_STATUSES:
+                    # Lease lost (this process stalled) and the job taken over elsewhere
+                    return
+                
+                if result is not None:
+                    content, tokens_used, metadata = result
+                    metadata["background"] = True
+                    message = ThreadService.new_assistant_message(
+                        job.thread_id, job.sequence, job.provider, content, tokens_used, metadata
+                    )
+                    db.add(message)
+                    try:
+                        await db.flush()
+                    except IntegrityError:
+                        await db.rollback()
+                        job = await db.get(LLMJob, job_id)
+                        error = "Thread was modified before the response completed"
+                    else:
+                        await UsageRollup(db).record_response(job.thread_id, job.provider, tokens_used, metadata)
+                        job.message_id = message.id
+                        job.status = JobStatus.COMPLETED
+                
+                if job.status != JobStatus.COMPLETED:
+                    job.status = JobStatus.FAILED
+                    job.error = error
+                await db.commit()
+        except Exception:
+            logger.exception(f"Failed to persist result of job {job_id}")
+        finally:
+            cls._notify(job_id)
@@ -1,5 +1,27 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, AsyncIterator
+from importlib.util import find_spec
+import httpx
+from .response_cache import ResponseCache
+from ..config import settings
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Create the pooled HTTP client of an API provider
+    
+    Long-lived: provider instances are shared for the whole process (see
+    ProviderFactory), so connections and TLS sessions are reused.
+    """
+    return httpx.AsyncClient(
+        http2=settings.llm_http2 and find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=settings.llm_max_connections,
+            max_keepalive_connections=settings.llm_max_keepalive_connections,
+            keepalive_expiry=settings.llm_keepalive_expiry,
+        ),
+        timeout=settings.llm_request_timeout,
+    )
 
 
 class LLMProvider(ABC):
@@ -21,14 +43,95 @@ class LLMProvider(ABC):
             messages: List of message dicts with 'role' and 'content'
             model: Optional model override
             previous_response_id: Optional previous response ID for stateful APIs (e.g., OpenAI Responses API)
-            background: Whether to run the request in background mode (for parallel processing)
+            background: Unused by the API, which runs background requests as jobs
+                (see start_background); kept for call compatibility
             **kwargs: Additional provider-specific parameters
-            
+        
         Returns:
             Tuple of (response_content, tokens_used, metadata)
         """
         pass
     
+    async def stream_message(
+        self, 
+        messages: List[Dict[str, str]], 
+        model: Optional[str] = None,
+        previous_response_id: Optional[str] = None,
+        **kwargs
+    ) -> AsyncIterator[Dict]:
+        """
+        Stream the LLM response as it is generated
+        
+        Yields event dicts with a 'type' key:
+            - 'delta': partial output, text chunk in 'text'
+            - 'completed': final event with 'content', 'tokens_used' and 'metadata',
+              matching the values returned by send_message
+        
+        Providers without native streaming fall back to a single delta
+        containing the whole response.
+        """
+        content, tokens_used, metadata = await self.send_message(
+            messages,
+            model=model,
+            previous_response_id=previous_response_id,
+            **kwargs
+        )
+        yield {"type": "delta", "text": content}
+        yield {
+            "type": "completed",
+            "content": content,
+            "tokens_used": tokens_used,
+            "metadata": metadata
+        }
+    
+    @property
+    def supports_previous_response_id(self) -> bool:
+        """
+        Whether the provider keeps conversation state server-side
+        
+        Such providers continue from previous_response_id and only need the new
+        message; others are sent the (token-budgeted) history every time.
+        """
+        return False
+    
+    @property
+    def supports_background(self) -> bool:
+        """Whether the provider can run a request server-side and be polled for it"""
+        return False
+    
+    async def start_background(
+        self, 
+        messages: List[Dict[str, str]], 
+        model: Optional[str] = None,
+        previous_response_id: Optional[str] = None,
+        **kwargs
+    ) -> str:
+        """
+        Start a server-side background request
+        
+        Args:
+            messages: List of message dicts with 'role' and 'content'
+            model: Optional model override
+            previous_response_id: Optional previous response ID for stateful APIs
+        
+        Returns:
+            Provider response ID to pass to retrieve_background
+        """
+        raise NotImplementedError(f"{self.provider_name} does not support background requests")
+    
+    async def retrieve_background(self, response_id: str) -> Optional[Tuple[str, int, Dict]]:
+        """
+        Check on a background request started with start_background
+        
+        Returns:
+            Tuple of (response_content, tokens_used, metadata) once completed,
+            None while the request is still queued or running
+        
+        Raises:
+            RuntimeError: If the request failed or was cancelled
+        """
+        raise NotImplementedError(f"{self.provider_name} does not support background requests")
+    
     @abstractmethod
     async def summarize(
         self, 
@@ -41,12 +144,41 @@ class LLMProvider(ABC):
         Args:
             text: Text to summarize
             model: Optional model override
-            
+        
         Returns:
             Tuple of (summary, tokens_used)
         """
         pass
     
+    async def _lookup_cache(
+        self,
+        request_params: Dict,
+        use_cache: Optional[bool]
+    ) -> Tuple[Optional[str], Optional[Tuple[str, int, Dict]]]:
+        """
+        Look a request up in the LLM response cache
+        
+        Returns:
+            Tuple of (cache key to store the response under, or None when the
+            cache is off for this request; cached response, or None on a miss)
+        """
+        if not ResponseCache.enabled(use_cache):
+            return None, None
+        cache_key = ResponseCache.make_key(self.provider_name, request_params)
+        return cache_key, await ResponseCache.get(cache_key)
+    
+    async def warmup(self):
+        """
+        Prepare the provider before the first request (e.g., open connections)
+        
+        Called once at application startup. Default is a no-op.
+        """
+        pass
+    
+    async def aclose(self):
+        """Release network resources held by the provider. Default is a no-op."""
+        pass
+    
     @property
     @abstractmethod
     def provider_name(self) -> str:
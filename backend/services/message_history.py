@@ -0,0 +1,167 @@
+from typing import Optional, List, Tuple
+from sqlalchemy import select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models import Thread, Message, MessageRole, ThreadType
+
+
+# (thread_id, exclusive lower sequence, inclusive upper sequence or None)
+Segment = Tuple[str, int, Optional[int]]
+
+
+class MessageHistory:
+    """
+    Resolves the messages visible in a thread
+    
+    Forks are copy-on-write: instead of duplicating rows, a fork stores the
+    sequence it was forked at (fork_sequence) and reads its parent's
+    messages up to that point at query time. Forks of forks chain the same
+    way, so a thread's history is a list of (thread, sequence range) segments.
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    @staticmethod
+    def inherits_prefix(thread: Thread) -> bool:
+        """Whether the thread reads a message prefix from its parent"""
+        return thread.thread_type == ThreadType.FORK and thread.fork_sequence is not None
+    
+    async def get_segments(self, thread: Thread) -> List[Segment]:
+        """
+        Get the (thread, sequence range) segments making up a thread's history
+        
+        Args:
+            thread: Thread to resolve
+        
+        Returns:
+            Segments from the thread itself up to its oldest fork ancestor
+        """
+        segments = []
+        upper = None
+        current = thread
+        
+        # The materialized path names every ancestor: load them all in one query
+        ancestors = {}
+        if self.inherits_prefix(thread) and thread.path:
+            ancestor_ids = thread.path.split("/")[:-1]
+            ancestors = {
+                t.id: t for t in (await self.db.execute(
+                    select(Thread).where(Thread.id.in_(ancestor_ids))
+                )).scalars().all()
+            }
+        
+        while True:
+            if not self.inherits_prefix(current):
+                segments.append((current.id, 0, upper))
+                return segments
+            
+            segments.append((current.id, current.fork_sequence, upper))
+            upper = current.fork_sequence if upper is None else min(upper, current.fork_sequence)
+            parent = ancestors.get(current.parent_thread_id)
+            if parent is None:
+                parent = (await self.db.execute(
+                    select(Thread).where(Thread.id == current.parent_thread_id)
+                )).scalars().first()
+            current = parent
+            if current is None:
+                return segments
+    
+    @staticmethod
+    def segments_filter(segments: List[Segment], up_to_sequence: Optional[int] = None):
+        """Build the WHERE clause selecting the messages in the given segments"""
+        clauses = []
+        for thread_id, lower, upper in segments:
+            if up_to_sequence is not None:
+                upper = up_to_sequence if upper is None else min(upper, up_to_sequence)
+            clause = and_(Message.thread_id == thread_id, Message.sequence > lower)
+            if upper is not None:
+                clause = and_(clause, Message.sequence <= upper)
+            clauses.append(clause)
+        return or_(*clauses)
+    
+    @staticmethod
+    def contains(segments: List[Segment], message: Message) -> bool:
+        """Whether a message is part of the history described by the segments"""
+        for thread_id, lower, upper in segments:
+            if message.thread_id == thread_id and message.sequence > lower:
+                return upper is None or message.sequence <= upper
+        return False
+    
+    async def get_messages(
+        self,
+        thread: Thread,
+        up_to_sequence: Optional[int] = None,
+        after_sequence: Optional[int] = None,
+        limit: Optional[int] = None,
+        from_end: bool = False
+    ) -> List[Message]:
+        """
+        Get messages visible in a thread, in sequence order
+        
+        Args:
+            thread: Thread to read
+            up_to_sequence: Optional last sequence to include
+            after_sequence: Optional sequence to start after (exclusive)
+            limit: Optional maximum number of messages
+            from_end: With a limit, take the last messages of the range instead of the first
+        
+        Returns:
+            List of Message objects, inherited prefix first
+        """
+        segments = await self.get_segments(thread)
+        messages = (await self.db.execute(
+            self.build_query(segments, up_to_sequence, after_sequence, limit, from_end)
+        )).scalars().all()
+        return list(reversed(messages)) if limit is not None and from_end else messages
+    
+    def build_query(
+        self,
+        segments: List[Segment],
+        up_to_sequence: Optional[int] = None,
+        after_sequence: Optional[int] = None,
+        limit: Optional[int] = None,
+        from_end: bool = False,
+        columns: Optional[list] = None
+    ):
+        """
+        Build the SELECT for a range of the messages in the given segments
+        
+        Selects Message entities, or only the given columns. Ordered by sequence,
+        descending when a limit is taken from the end of the range.
+        """
+        query = select(*(columns or [Message])).where(self.segments_filter(segments, up_to_sequence))
+        if after_sequence is not None:
+            query = query.where(Message.sequence > after_sequence)
+        
+        if limit is not None and from_end:
+            return query.order_by(Message.sequence.desc()).limit(limit)
+        query = query.order_by(Message.sequence)
+        return query.limit(limit) if limit is not None else query
+    
+    async def get_last_message(
+        self,
+        thread: Thread,
+        role: Optional[MessageRole] = None,
+        with_response_id: bool = False,
+        first: bool = False
+    ) -> Optional[Message]:
+        """
+        Get the last (or first) visible message in a thread
+        
+        Args:
+            thread: Thread to read
+            role: Optional role filter
+            with_response_id: Only consider messages with an openai_response_id
+            first: Return the first matching message instead of the last
+        
+        Returns:
+            Message or None
+        """
+        segments = await self.get_segments(thread)
+        query = select(Message).where(self.segments_filter(segments))
+        if role is not None:
+            query = query.where(Message.role == role)
+        if with_response_id:
+            query = query.where(Message.openai_response_id.isnot(None))
+        order = Message.sequence if first else Message.sequence.desc()
+        return (await self.db.execute(query.order_by(order).limit(1))).scalars().first()
@@ -1,6 +1,8 @@
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, AsyncIterator
 from openai import AsyncOpenAI
-from .llm_provider import LLMProvider
+from .llm_provider import LLMProvider, create_http_client
+from ..metrics import observe_llm
+from .response_cache import ResponseCache
 from ..config import settings
 import logging
 
@@ -11,9 +13,11 @@ class OpenAIProvider(LLMProvider):
     """OpenAI API provider implementation"""
     
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.openai_api_key)
+        self.http_client = create_http_client()
+        self.client = AsyncOpenAI(api_key=settings.openai_api_key, http_client=self.http_client)
         self.default_model = settings.default_openai_model
     
+    @observe_llm("send_message")
     async def send_message(
         self, 
         messages: List[Dict[str, str]], 
@@ -22,7 +26,126 @@ class OpenAIProvider(LLMProvider):
         background: Optional[bool] = False,
         **kwargs
     ) -> Tuple[str, int, Dict]:
-        """Send messages to OpenAI Responses API"""
+        """Send messages to OpenAI Responses API (use_cache=False bypasses the response cache)"""
+        # Background requests are started with start_background and polled by the JobPoller
+        request_params = self._build_request_params(
+            messages, model, previous_response_id, False, kwargs
+        )
+        
+        cache_key, cached = await self._lookup_cache(request_params, kwargs.get("use_cache"))
+        if cached is not None:
+            return cached
+        
+        # Call Responses API
+        response = await self.client.responses.create(**request_params)
+        
+        content = self._extract_content(response)
+        tokens_used, metadata = self._build_metadata(response, False)
+        
+        if cache_key and content and response.status == "completed":
+            await ResponseCache.put(cache_key, self.provider_name, content, tokens_used, metadata)
+        
+        return content, tokens_used, metadata
+    
+    @property
+    def supports_previous_response_id(self) -> bool:
+        return True
+    
+    @property
+    def supports_background(self) -> bool:
+        return True
+    
+    async def start_background(
+        self, 
+        messages: List[Dict[str, str]], 
+        model: Optional[str] = None,
+        previous_response_id: Optional[str] = None,
+        **kwargs
+    ) -> str:
+        """Start a background Responses API request and return its response ID"""
+        request_params = self._build_request_params(
+            messages, model, previous_response_id, True, kwargs
+        )
+        response = await self.client.responses.create(**request_params)
+        return response.id
+    
+    async def retrieve_background(self, response_id: str) -> Optional[Tuple[str, int, Dict]]:
+        """Retrieve a background response: None while queued / in progress"""
+        response = await self.client.responses.retrieve(response_id)
+        if response.status in ("queued", "in_progress"):
+            return None
+        if response.status != "completed":
+            raise RuntimeError(f"Background response ended with status '{response.status}'")
+        
+        tokens_used, metadata = self._build_metadata(response, True)
+        return self._extract_content(response), tokens_used, metadata
+    
+    @staticmethod
+    def _extract_content(response) -> str:
+        """Get the assistant output text of a Responses API response"""
+        content = response.output_text if hasattr(response, 'output_text') else ""
+        if not content and response.output:
+            # Fallback: extract from output array
+            for item in response.output:
+                if item.get("type") == "message" and item.get("role") == "assistant":
+                    for content_item in item.get("content", []):
+                        if content_item.get("type") == "output_text":
+                            content = content_item.get("text", "")
+                            break
+        return content
+    
+    @observe_llm("stream_message")
+    async def stream_message(
+        self, 
+        messages: List[Dict[str, str]], 
+        model: Optional[str] = None,
+        previous_response_id: Optional[str] = None,
+        **kwargs
+    ) -> AsyncIterator[Dict]:
+        """Stream output text deltas from OpenAI Responses API"""
+        request_params = self._build_request_params(
+            messages, model, previous_response_id, False, kwargs
+        )
+        
+        cache_key, cached = await self._lookup_cache(request_params, kwargs.get("use_cache"))
+        if cached is not None:
+            content, tokens_used, metadata = cached
+            yield {"type": "delta", "text": content}
+            yield {"type": "completed", "content": content, "tokens_used": tokens_used, "metadata": metadata}
+            return
+        
+        request_params["stream"] = True
+        stream = await self.client.responses.create(**request_params)
+        
+        content_parts = []
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                content_parts.append(event.delta)
+                yield {"type": "delta", "text": event.delta}
+            elif event.type == "response.completed":
+                tokens_used, metadata = self._build_metadata(event.response, False)
+                content = "".join(content_parts)
+                if cache_key and content:
+                    await ResponseCache.put(cache_key, self.provider_name, content, tokens_used, metadata)
+                metadata["streamed"] = True
+                yield {
+                    "type": "completed",
+                    "content": content,
+                    "tokens_used": tokens_used,
+                    "metadata": metadata
+                }
+            elif event.type in ("response.failed", "response.incomplete", "error"):
+                raise RuntimeError(f"Streaming response ended with '{event.type}'")
+    
+    def _build_request_params(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str],
+        previous_response_id: Optional[str],
+        background: Optional[bool],
+        kwargs: Dict
+    ) -> Dict:
+        """Build Responses API request parameters from chat-style messages"""
         model_to_use = model or self.default_model
         
         # Separate system messages (instructions) from user/assistant messages
@@ -61,34 +184,10 @@ class OpenAIProvider(LLMProvider):
         if "max_tokens" in kwargs:
             request_params["max_output_tokens"] = kwargs["max_tokens"]
         
-        # Call Responses API
-        response = await self.client.responses.create(**request_params)
-        
-        # Handle background requests: poll until completion
-        if background and response.status in ["in_progress", "queued"]:
-            import asyncio
-            import time
-            max_wait_time = 300  # 5 minutes max
-            check_interval = 1  # Poll every 1 second
-            start_time = time.time()
-            
-            while response.status in ["in_progress", "queued"]:
-                if time.time() - start_time > max_wait_time:
-                    raise TimeoutError("Background request did not complete within timeout")
-                await asyncio.sleep(check_interval)
-                response = await self.client.responses.retrieve(response.id)
-        
-        # Extract content from response
-        content = response.output_text if hasattr(response, 'output_text') else ""
-        if not content and response.output:
-            # Fallback: extract from output array
-            for item in response.output:
-                if item.get("type") == "message" and item.get("role") == "assistant":
-                    for content_item in item.get("content", []):
-                        if content_item.get("type") == "output_text":
-                            content = content_item.get("text", "")
-                            break
-        
+        return request_params
+    
+    def _build_metadata(self, response, background: Optional[bool]) -> Tuple[int, Dict]:
+        """Extract token usage and branching metadata from a Responses API response"""
         # Safely get token usage (might not be available for incomplete responses)
         tokens_used = response.usage.total_tokens if hasattr(response, 'usage') and response.usage else 0
         
@@ -101,8 +200,9 @@ class OpenAIProvider(LLMProvider):
             "background": background,
         }
         
-        return content, tokens_used, metadata
+        return tokens_used, metadata
     
+    @observe_llm("summarize")
     async def summarize(
         self, 
         text: str, 
@@ -134,6 +234,19 @@ class OpenAIProvider(LLMProvider):
         
         return summary, tokens_used
     
+    async def warmup(self):
+        """Open a pooled connection to the API so the first message skips the TLS handshake"""
+        if not settings.openai_api_key:
+            return
+        try:
+            await self.client.models.list()
+        except Exception as e:
+            logger.warning(f"OpenAI warm-up failed: {e}")
+    
+    async def aclose(self):
+        """Close the pooled HTTP client"""
+        await self.client.close()
+    
     @property
     def provider_name(self) -> str:
         return "openai"
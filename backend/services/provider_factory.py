@@ -1,19 +1,32 @@
+from typing import Dict, Iterable, Type, Union
+from importlib import import_module
 from .llm_provider import LLMProvider
-from .openai_provider import OpenAIProvider
 from ..config import settings
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 
 class ProviderFactory:
-    """Factory for creating LLM provider instances"""
+    """Factory for LLM provider instances, shared for the lifetime of the process"""
     
-    _providers = {
-        "openai": OpenAIProvider,
+    # Provider name -> "module:ClassName" (relative to this package), imported
+    # on first use so SDKs like openai stay out of the startup import path.
+    # Provider classes may also be registered directly.
+    _providers: Dict[str, Union[str, Type[LLMProvider]]] = {
+        "openai": ".openai_provider:OpenAIProvider",
+        "anthropic": ".anthropic_provider:AnthropicProvider",
+        "fake": ".fake_provider:FakeProvider",
     }
     
+    # Provider name -> shared instance (each owns a pooled HTTP client)
+    _instances: Dict[str, LLMProvider] = {}
+    
     @classmethod
     def get_provider(cls, provider_name: str = None) -> LLMProvider:
         """
-        Get an instance of the specified provider
+        Get the shared instance of the specified provider
         
         Args:
             provider_name: Name of provider ('openai', 'anthropic', etc.)
@@ -36,10 +49,69 @@ class ProviderFactory:
                 f"Available providers: {list(cls._providers.keys())}"
             )
         
-        return cls._providers[provider_name]()
+        if provider_name not in cls._instances:
+            provider_class = cls._resolve(provider_name)
+            cls._instances[provider_name] = provider_class()
+        
+        return cls._instances[provider_name]
+    
+    @classmethod
+    def register(cls, provider_name: str, provider: Union[str, Type[LLMProvider]]):
+        """
+        Register a provider under a name
+        
+        Args:
+            provider_name: Name used in requests and settings
+            provider: Provider class, or "module:ClassName" path to import lazily
+        """
+        cls._providers[provider_name.lower()] = provider
+        cls._instances.pop(provider_name.lower(), None)
+    
+    @classmethod
+    def _resolve(cls, provider_name: str) -> Type[LLMProvider]:
+        """Import a lazily registered provider class and cache it in the registry"""
+        provider = cls._providers[provider_name]
+        if not isinstance(provider, str):
+            return provider
+        
+        module_path, class_name = provider.split(":")
+        started = time.perf_counter()
+        module = import_module(module_path, package=__package__)
+        logger.info(
+            f"Imported provider '{provider_name}' in "
+            f"{(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        
+        provider_class = getattr(module, class_name)
+        cls._providers[provider_name] = provider_class
+        return provider_class
+    
+    @classmethod
+    async def warmup(cls, provider_names: Iterable[str]):
+        """
+        Create and warm up providers at startup
+        
+        Args:
+            provider_names: Providers to prepare. Failures (unknown name, missing
+                            API key) are logged so startup still succeeds.
+        """
+        for provider_name in set(provider_names):
+            try:
+                provider = cls.get_provider(provider_name)
+            except Exception as e:
+                logger.warning(f"Could not start provider '{provider_name}': {e}")
+                continue
+            await provider.warmup()
+    
+    @classmethod
+    async def shutdown(cls):
+        """Close every shared provider instance"""
+        instances = list(cls._instances.values())
+        cls._instances.clear()
+        for provider in instances:
+            await provider.aclose()
     
     @classmethod
     def list_providers(cls) -> list:
         """List all available providers"""
         return list(cls._providers.keys())
-
@@ -0,0 +1,180 @@
+from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.sqlite import insert
+import hashlib
+import logging
+import time
+
+import orjson
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import LLMCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Prune the table (expired rows, then least recently used beyond the size cap) every N writes
+PRUNE_EVERY = 100
+
+
+class ResponseCache:
+    """
+    Two-tier cache of LLM responses
+    
+    Keyed by a hash of everything that determines the answer: provider, model,
+    instructions, input and previous_response_id (plus sampling parameters).
+    The in-memory LRU answers repeated requests without I/O; the
+    llm_response_cache table keeps answers across restarts. Both tiers expire
+    entries after llm_cache_ttl and evict least recently used entries beyond
+    their size cap.
+    """
+    
+    # key -> (expires at, (content, tokens_used, metadata)), least recently used first
+    _memory: "OrderedDict[str, Tuple[float, Tuple[str, int, Dict]]]" = OrderedDict()
+    _writes = 0
+    _stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+    
+    @staticmethod
+    def enabled(use_cache: Optional[bool] = True) -> bool:
+        """Whether a request should go through the cache"""
+        return settings.llm_cache_enabled and use_cache is not False
+    
+    @staticmethod
+    def make_key(provider_name: str, request_params: Dict) -> str:
+        """Hash the provider and request parameters into a cache key"""
+        payload = orjson.dumps(
+            {"provider": provider_name, "params": request_params},
+            option=orjson.OPT_SORT_KEYS
+        )
+        return hashlib.sha256(payload).hexdigest()
+    
+    @classmethod
+    async def get(cls, key: str) -> Optional[Tuple[str, int, Dict]]:
+        """
+        Look up a cached response
+        
+        Returns:
+            Tuple of (response_content, tokens_used, metadata) with
+            metadata["cache_hit"] set and tokens_used 0 (nothing was spent),
+            or None on a miss
+        """
+        entry = cls._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                cls._memory.move_to_end(key)
+                cls._stats["memory_hits"] += 1
+                return cls._hit(value, "memory")
+            del cls._memory[key]
+        
+        async with SessionLocal() as db:
+            row = await db.get(LLMCacheEntry, key)
+            if row is None or row.expires_at <= datetime.utcnow():
+                cls._stats["misses"] += 1
+                return None
+            row.last_used_at = datetime.utcnow()
+            value = (row.content, row.tokens_used or 0, dict(row.response_metadata or {}))
+            expires_at = (row.expires_at - datetime.utcnow()).total_seconds() + time.time()
+            await db.commit()
+        
+        cls._remember(key, expires_at, value)
+        cls._stats["db_hits"] += 1
+        return cls._hit(value, "db")
+    
+    @classmethod
+    async def put(cls, key: str, provider_name: str, content: str, tokens_used: int, metadata: Dict):
+        """Store a completed response in both tiers"""
+        now = datetime.utcnow()
+        value = (content, tokens_used, dict(metadata))
+        cls._remember(key, time.time() + settings.llm_cache_ttl, value)
+        
+        async with SessionLocal() as db:
+            # Upsert: identical requests completing together store the same key
+            statement = insert(LLMCacheEntry).values(
+                key=key,
+                provider=provider_name,
+                model=metadata.get("model"),
+                content=content,
+                tokens_used=tokens_used,
+                response_metadata=value[2],
+                created_at=now,
+                expires_at=now + timedelta(seconds=settings.llm_cache_ttl),
+                last_used_at=now
+            )
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=["key"],
+                set_={
+                    name: getattr(statement.excluded, name)
+                    for name in (
+                        "provider", "model", "content", "tokens_used", "response_metadata",
+                        "created_at", "expires_at", "last_used_at"
+                    )
+                }
+            ))
+            await db.commit()
+        cls._stats["stores"] += 1
+        
+        cls._writes += 1
+        if cls._writes % PRUNE_EVERY == 0:
+            await cls.prune()
+    
+    @classmethod
+    async def prune(cls) -> int:
+        """Delete expired rows and the least recently used rows beyond llm_cache_max_entries"""
+        async with SessionLocal() as db:
+            expired = await db.execute(
+                delete(LLMCacheEntry).where(LLMCacheEntry.expires_at <= datetime.utcnow()),
+                execution_options={"synchronize_session": False}
+            )
+            removed = expired.rowcount
+            
+            count = (await db.execute(select(func.count()).select_from(LLMCacheEntry))).scalar()
+            excess = count - settings.llm_cache_max_entries
+            if excess > 0:
+                oldest = select(LLMCacheEntry.key).order_by(LLMCacheEntry.last_used_at).limit(excess)
+                evicted = await db.execute(
+                    delete(LLMCacheEntry).where(LLMCacheEntry.key.in_(oldest)),
+                    execution_options={"synchronize_session": False}
+                )
+                removed += evicted.rowcount
+            await db.commit()
+        
+        cls._stats["evictions"] += removed
+        return removed
+    
+    @classmethod
+    async def clear(cls) -> int:
+        """Drop every cached response"""
+        cls._memory.clear()
+        async with SessionLocal() as db:
+            result = await db.execute(delete(LLMCacheEntry), execution_options={"synchronize_session": False})
+            await db.commit()
+        return result.rowcount
+    
+    @classmethod
+    def stats(cls) -> Dict:
+        """Hit / miss counters since startup and the current memory tier size"""
+        hits = cls._stats["memory_hits"] + cls._stats["db_hits"]
+        lookups = hits + cls._stats["misses"]
+        return {
+            **cls._stats,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(cls._memory),
+            "enabled": settings.llm_cache_enabled
+        }
+    
+    @classmethod
+    def _remember(cls, key: str, expires_at: float, value: Tuple[str, int, Dict]):
+        cls._memory[key] = (expires_at, value)
+        cls._memory.move_to_end(key)
+        while len(cls._memory) > settings.llm_cache_memory_entries:
+            cls._memory.popitem(last=False)
+            cls._stats["evictions"] += 1
+    
+    @staticmethod
+    def _hit(value: Tuple[str, int, Dict], tier: str) -> Tuple[str, int, Dict]:
+        content, tokens_used, metadata = value
+        # Callers add to the metadata they get back: never hand out the cached dict
+        return content, 0, {**metadata, "cache_hit": True, "cache_tier": tier, "cached_tokens_used": tokens_used}
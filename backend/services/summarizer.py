@@ -1,16 +1,32 @@
-from typing import Optional, Tuple
-from sqlalchemy.orm import Session
-from ..models import Thread, Message, ThreadContext
+from typing import Optional, Tuple, List
+from datetime import datetime
+from sqlalchemy import select, and_, or_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+from ..database import SessionLocal
+from ..models import Thread, Message, ThreadContext, PrefixSummary
+from .llm_provider import LLMProvider
+from .message_history import MessageHistory, Segment
 from .provider_factory import ProviderFactory
+from .usage import UsageRollup
 from ..config import settings
 
 
 class Summarizer:
     """Service for generating conversation summaries"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
-        self.provider = ProviderFactory.get_provider(settings.summarization_provider)
+        self.history = MessageHistory(db)
+        self._provider = None
+    
+    @property
+    def provider(self) -> LLMProvider:
+        """Summarization provider, resolved on first summary"""
+        if self._provider is None:
+            self._provider = ProviderFactory.get_provider(settings.summarization_provider)
+        return self._provider
     
     async def generate_parent_summary(
         self, 
@@ -27,26 +43,73 @@ class Summarizer:
         Returns:
             Tuple of (summary, tokens_used)
         """
-        # Get parent thread messages
-        query = self.db.query(Message).filter(
-            Message.thread_id == parent_thread_id
-        ).order_by(Message.sequence)
+        parent_thread = (await self.db.execute(
+            select(Thread).where(Thread.id == parent_thread_id)
+        )).scalars().first()
+        if not parent_thread:
+            return "", 0
         
         # If branching from specific message, only include messages up to that point
+        up_to_sequence = None
         if up_to_message_id:
-            branch_message = self.db.query(Message).filter(
-                Message.id == up_to_message_id
-            ).first()
+            branch_message = (await self.db.execute(
+                select(Message).where(Message.id == up_to_message_id)
+            )).scalars().first()
             if branch_message:
-                query = query.filter(Message.sequence <= branch_message.sequence)
+                up_to_sequence = branch_message.sequence
+        
+        # Branches off the same parent share (and extend) cached prefix summaries
+        return await self.summarize_prefix(parent_thread, up_to_sequence)
+    
+    async def summarize_prefix(
+        self,
+        thread: Thread,
+        up_to_sequence: Optional[int] = None
+    ) -> Tuple[str, int]:
+        """
+        Summarize a thread's visible history up to a sequence, reusing cached prefixes
         
-        messages = query.all()
+        A cached summary of exactly this prefix is returned as is. Otherwise the
+        longest cached shorter prefix (of this thread, or of an ancestor a fork
+        inherits it from) is extended with only the messages after it, and the
+        result is cached under (thread_id, up_to_sequence) of the thread owning
+        the prefix's last message, so forks of one ancestor share entries for
+        the prefix they inherit.
         
-        if not messages:
+        Args:
+            thread: Thread whose history to summarize
+            up_to_sequence: Optional last sequence to include (default: whole history)
+        
+        Returns:
+            Tuple of (summary, tokens_used); tokens_used is 0 on an exact cache hit
+        """
+        segments = await self.history.get_segments(thread)
+        last_message = (await self.db.execute(
+            self.history.build_query(segments, up_to_sequence, limit=1, from_end=True)
+        )).scalars().first()
+        if not last_message:
             return "", 0
         
+        cached = await self._get_nearest_prefix(segments, last_message.sequence)
+        if cached and cached.up_to_sequence == last_message.sequence:
+            return cached.summary, 0
+        
+        # Get the messages not covered by the cached prefix (including a fork's inherited prefix)
+        messages = (await self.db.execute(
+            self.history.build_query(
+                segments,
+                last_message.sequence,
+                after_sequence=cached.up_to_sequence if cached else None
+            )
+        )).scalars().all()
+        
         # Format conversation for summarization
         conversation_text = self._format_messages_for_summary(messages)
+        if cached:
+            conversation_text = (
+                f"Summary of the earlier conversation:\n{cached.summary}\n\n"
+                f"Continuation of the conversation:\n{conversation_text}"
+            )
         
         # Generate summary
         summary, tokens = await self.provider.summarize(
@@ -54,8 +117,55 @@ class Summarizer:
             model=settings.summarization_model
         )
         
+        # Upsert: a concurrent summary of the same prefix (two branches from one
+        # message, a regenerate racing a send) may have been stored meanwhile
+        # Keyed by the segment owner: for a prefix a fork inherits, the ancestor
+        statement = insert(PrefixSummary).values(
+            thread_id=last_message.thread_id,
+            up_to_sequence=last_message.sequence,
+            last_message_id=last_message.id,
+            summary=summary,
+            tokens_used=tokens,
+            created_at=datetime.utcnow()
+        )
+        await self.db.execute(statement.on_conflict_do_update(
+            index_elements=["thread_id", "up_to_sequence"],
+            set_={
+                name: getattr(statement.excluded, name)
+                for name in ("last_message_id", "summary", "tokens_used", "created_at")
+            }
+        ))
+        await UsageRollup(self.db).record(
+            thread.id, self.provider.provider_name, settings.summarization_model, tokens
+        )
+        await self.db.commit()
+        
         return summary, tokens
     
+    async def _get_nearest_prefix(self, segments: List[Segment], up_to_sequence: int) -> Optional[PrefixSummary]:
+        """
+        Get the longest cached summary of a prefix of the given history
+        
+        Summaries of the thread itself, or of an ancestor up to where the
+        thread inherits from it, qualify. Entries whose last message is no
+        longer at their sequence in this history (the prefix changed) are skipped.
+        """
+        bounds = []
+        for thread_id, _, upper in segments:
+            bound = up_to_sequence if upper is None else min(upper, up_to_sequence)
+            bounds.append(and_(PrefixSummary.thread_id == thread_id, PrefixSummary.up_to_sequence <= bound))
+        
+        return (await self.db.execute(
+            select(PrefixSummary)
+            .join(Message, and_(
+                Message.id == PrefixSummary.last_message_id,
+                Message.sequence == PrefixSummary.up_to_sequence
+            ))
+            .where(or_(*bounds), self.history.segments_filter(segments, up_to_sequence))
+            .order_by(PrefixSummary.up_to_sequence.desc())
+            .limit(1)
+        )).scalars().first()
+    
     async def generate_sibling_summary(
         self, 
         thread_id: str
@@ -63,6 +173,11 @@ class Summarizer:
         """
         Generate summary of all sibling threads
         
+        Each sibling is summarized on its own (cached per sibling up to its
+        last message, see summarize_prefix), with at most
+        summarization_concurrency at a time; the short per-sibling summaries
+        are then combined in one final call.
+        
         Args:
             thread_id: ID of current thread
         
@@ -70,43 +185,87 @@ class Summarizer:
             Tuple of (summary, tokens_used)
         """
         # Get current thread to find parent
-        thread = self.db.query(Thread).filter(Thread.id == thread_id).first()
+        thread = (await self.db.execute(
+            select(Thread).where(Thread.id == thread_id)
+        )).scalars().first()
         if not thread or not thread.parent_thread_id:
             return "", 0
         
         # Get all sibling threads (same parent, different id)
-        siblings = self.db.query(Thread).filter(
-            Thread.parent_thread_id == thread.parent_thread_id,
-            Thread.id != thread_id
-        ).all()
+        siblings = (await self.db.execute(
+            select(Thread).where(
+                Thread.parent_thread_id == thread.parent_thread_id,
+                Thread.id != thread_id
+            )
+        )).scalars().all()
         
         if not siblings:
             return "", 0
         
-        # Collect all sibling conversations
+        semaphore = asyncio.Semaphore(settings.summarization_concurrency)
+        
+        async def summarize_sibling(sibling: Thread) -> Tuple[str, int]:
+            async with semaphore:
+                return await self._in_own_session("summarize_prefix", sibling)
+        
+        results = await asyncio.gather(*(summarize_sibling(s) for s in siblings))
+        
         sibling_texts = []
-        for sibling in siblings:
-            messages = self.db.query(Message).filter(
-                Message.thread_id == sibling.id
-            ).order_by(Message.sequence).all()
-            
-            if messages:
+        tokens = 0
+        for sibling, (sibling_summary, sibling_tokens) in zip(siblings, results):
+            tokens += sibling_tokens
+            if sibling_summary:
                 title = sibling.title or f"Thread {sibling.id[:8]}"
-                conv_text = self._format_messages_for_summary(messages)
-                sibling_texts.append(f"### {title}\n{conv_text}")
+                sibling_texts.append(f"### {title}\n{sibling_summary}")
         
         if not sibling_texts:
-            return "", 0
+            return "", tokens
         
         combined_text = "\n\n".join(sibling_texts)
         
-        # Generate combined summary
-        summary, tokens = await self.provider.summarize(
-            f"Multiple parallel conversations:\n\n{combined_text}",
+        # Reduce the per-sibling summaries into one
+        summary, reduce_tokens = await self.provider.summarize(
+            f"Summaries of multiple parallel conversations:\n\n{combined_text}",
             model=settings.summarization_model
         )
+        await UsageRollup(self.db).record(
+            thread_id, self.provider.provider_name, settings.summarization_model, reduce_tokens
+        )
+        await self.db.commit()
         
-        return summary, tokens
+        return summary, tokens + reduce_tokens
+    
+    async def regenerate_summaries(
+        self,
+        thread: Thread,
+        regenerate_parent: bool = True,
+        regenerate_siblings: bool = False
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Regenerate a thread's parent and sibling summaries concurrently
+        
+        Returns:
+            Tuple of (parent_summary, sibling_summary); None for summaries not regenerated
+        """
+        async def none() -> Tuple[None, int]:
+            return None, 0
+        
+        if regenerate_parent and thread.parent_thread_id:
+            parent = self._in_own_session(
+                "generate_parent_summary", thread.parent_thread_id, thread.branch_from_message_id
+            )
+        else:
+            parent = none()
+        siblings = self._in_own_session("generate_sibling_summary", thread.id) if regenerate_siblings else none()
+        
+        (parent_summary, _), (sibling_summary, _) = await asyncio.gather(parent, siblings)
+        return parent_summary, sibling_summary
+    
+    @staticmethod
+    async def _in_own_session(method: str, *args):
+        """Run a Summarizer method with its own session, so several can run at once"""
+        async with SessionLocal() as db:
+            return await getattr(Summarizer(db), method)(*args)
     
     def _format_messages_for_summary(self, messages: list) -> str:
         """Format messages into readable conversation text"""
@@ -123,9 +282,9 @@ class Summarizer:
         sibling_summary: Optional[str] = None
     ):
         """Save or update thread context"""
-        context = self.db.query(ThreadContext).filter(
-            ThreadContext.thread_id == thread_id
-        ).first()
+        context = (await self.db.execute(
+            select(ThreadContext).where(ThreadContext.thread_id == thread_id)
+        )).scalars().first()
         
         if context:
             if parent_summary is not None:
@@ -140,5 +299,5 @@ class Summarizer:
             )
             self.db.add(context)
         
-        self.db.commit()
+        await self.db.commit()
 
@@ -1,16 +1,38 @@
-from typing import Optional, List, Dict
-from sqlalchemy.orm import Session
+from typing import Optional, List, Dict, Tuple
+from datetime import datetime
+from sqlalchemy import select, delete, tuple_, and_
+import base64
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
-from ..models import Thread, Message, ThreadContext, MessageRole, ThreadType
+from ..models import Thread, Message, ThreadContext, MessageRole, ThreadType, LLMJob, IdempotencyKey, PrefixSummary
+from ..schemas import ThreadResponse, dump_trusted
 from .summarizer import Summarizer
+from .message_history import MessageHistory
+from .tokens import estimate_tokens
+from .usage import UsageRollup
 
 
 class ThreadService:
     """Business logic for thread operations"""
     
-    def __init__(self, db: Session):
+    # Message columns returned to clients
+    _MESSAGE_COLUMNS = [
+        Message.id, Message.thread_id, Message.role, Message.content, Message.sequence,
+        Message.timestamp, Message.model, Message.provider, Message.tokens_used,
+        Message.response_metadata
+    ]
+    
+    def __init__(self, db: AsyncSession):
         self.db = db
-        self.summarizer = Summarizer(db)
+        self.history = MessageHistory(db)
+        self._summarizer = None
+    
+    @property
+    def summarizer(self) -> Summarizer:
+        """Summarizer, built only when summaries are actually generated"""
+        if self._summarizer is None:
+            self._summarizer = Summarizer(self.db)
+        return self._summarizer
     
     async def create_thread(
         self,
@@ -28,6 +50,8 @@ class ThreadService:
             parent_thread_id: Parent thread ID if branching
             branch_from_message_id: Message ID that spawned this branch
             branch_context_text: Selected text context for branch
+            is_fork: Create a copy-on-write fork that inherits the parent's
+                     messages up to branch_from_message_id without copying them
         
         Returns:
             Created Thread object
@@ -35,20 +59,27 @@ class ThreadService:
         # Validate parent thread exists if provided
         parent_thread = None
         if parent_thread_id:
-            parent_thread = self.db.query(Thread).filter(
-                Thread.id == parent_thread_id
-            ).first()
+            parent_thread = (await self.db.execute(
+                select(Thread).where(Thread.id == parent_thread_id)
+            )).scalars().first()
             if not parent_thread:
                 raise ValueError(f"Parent thread {parent_thread_id} not found")
         
         # Validate branch message exists if provided
+        branch_message = None
         if branch_from_message_id:
-            branch_message = self.db.query(Message).filter(
-                Message.id == branch_from_message_id
-            ).first()
+            branch_message = (await self.db.execute(
+                select(Message).where(Message.id == branch_from_message_id)
+            )).scalars().first()
             if not branch_message:
                 raise ValueError(f"Branch message {branch_from_message_id} not found")
-            if parent_thread_id and branch_message.thread_id != parent_thread_id:
+            # Messages a fork inherits from its own parents count as part of it
+            if parent_thread_id and not (
+                branch_message.thread_id == parent_thread_id
+                or MessageHistory.contains(
+                    await self.history.get_segments(parent_thread), branch_message
+                )
+            ):
                 raise ValueError("Branch message must belong to parent thread")
         
         # Determine thread type, depth, and ID
@@ -59,7 +90,7 @@ class ThreadService:
         elif parent_thread_id:
             thread_type = ThreadType.BRANCH
             depth = parent_thread.depth + 1
-            thread_id = None  # Let SQLAlchemy generate
+            thread_id = str(uuid.uuid4())  # Needed up front for the materialized path
         else:
             thread_type = ThreadType.ROOT
             depth = 0
@@ -77,47 +108,28 @@ class ThreadService:
             branch_text_end_offset=branch_text_end_offset if not is_fork else None
         )
         
-        self.db.add(thread)
-        self.db.commit()
-        self.db.refresh(thread)
-        
-        # For forks: duplicate messages from parent thread
-        if is_fork and parent_thread_id and branch_from_message_id:
-            fork_message = self.db.query(Message).filter(
-                Message.id == branch_from_message_id
-            ).first()
+        # Materialized path: extend the parent's, or start a new tree
+        if parent_thread:
+            parent_path = await self._get_path(parent_thread)
+            thread.root_id = parent_path.split("/", 1)[0]
+            thread.path = f"{parent_path}/{thread_id}"
+        else:
+            thread.root_id = thread_id
+            thread.path = thread_id
+        
+        # For forks: reference the parent's messages up to the fork point (O(1), no copies)
+        if is_fork and parent_thread_id and branch_message:
+            thread.fork_sequence = branch_message.sequence
             
-            if fork_message:
-                # Get all messages up to and including the fork point
-                messages_to_duplicate = self.db.query(Message).filter(
-                    Message.thread_id == parent_thread_id,
-                    Message.sequence <= fork_message.sequence
-                ).order_by(Message.sequence).all()
-                
-                # Duplicate each message
-                for msg in messages_to_duplicate:
-                    new_message = Message(
-                        id=str(uuid.uuid4()),
-                        thread_id=thread.id,
-                        role=msg.role,
-                        content=msg.content,
-                        sequence=msg.sequence,
-                        timestamp=msg.timestamp,
-                        model=msg.model,
-                        provider=msg.provider,
-                        tokens_used=msg.tokens_used,
-                        response_metadata=msg.response_metadata,
-                        openai_response_id=msg.openai_response_id  # Keep same for OpenAI API
-                    )
-                    self.db.add(new_message)
-                
-                # Set initial fork title (temporary until user sends first message)
-                if parent_thread.title:
-                    thread.title = f"Fork | {parent_thread.title}"
-                else:
-                    thread.title = "Fork | New Thread"
-                
-                self.db.commit()
+            # Set initial fork title (temporary until user sends first message)
+            if parent_thread.title:
+                thread.title = f"Fork | {parent_thread.title}"
+            else:
+                thread.title = "Fork | New Thread"
+        
+        self.db.add(thread)
+        await self.db.commit()
+        await self.db.refresh(thread)
         
         # Generate parent summary if this is a branch and summarization is enabled
         # OpenAI Responses API doesn't need this (uses previous_response_id)
@@ -135,17 +147,146 @@ class ThreadService:
         
         return thread
     
-    def get_thread(self, thread_id: str) -> Optional[Thread]:
+    async def get_thread(self, thread_id: str) -> Optional[Thread]:
         """Get thread by ID"""
-        return self.db.query(Thread).filter(Thread.id == thread_id).first()
+        return (await self.db.execute(
+            select(Thread).where(Thread.id == thread_id)
+        )).scalars().first()
+    
+    async def _get_path(self, thread: Thread) -> str:
+        """Materialized path of a thread, rebuilt from parent links for rows created before paths existed"""
+        if thread.path:
+            return thread.path
+        ids = [thread.id]
+        current = thread
+        while current.parent_thread_id:
+            current = await self.get_thread(current.parent_thread_id)
+            if not current:
+                break
+            if current.path:
+                return "/".join([current.path] + list(reversed(ids)))
+            ids.append(current.id)
+        return "/".join(reversed(ids))
+    
+    async def get_ancestors(self, thread: Thread) -> List[Thread]:
+        """
+        Get all ancestors of a thread in one query
+        
+        Returns:
+            List of Thread objects, root first, excluding the thread itself
+        """
+        ancestor_ids = (await self._get_path(thread)).split("/")[:-1]
+        if not ancestor_ids:
+            return []
+        ancestors = (await self.db.execute(
+            select(Thread).where(Thread.id.in_(ancestor_ids))
+        )).scalars().all()
+        return sorted(ancestors, key=lambda t: t.depth)
+    
+    async def get_tree(self, thread: Thread, max_depth: Optional[int] = None) -> Dict:
+        """
+        Get the nested subtree rooted at a thread
+        
+        Descendants are fetched with one range scan over the materialized path,
+        then nested in memory.
+        
+        Args:
+            thread: Subtree root
+            max_depth: Optional number of levels below the thread to include
+        
+        Returns:
+            Nested dict of thread fields with 'children' lists (ordered by creation)
+        """
+        path = await self._get_path(thread)
+        # Paths of descendants sort between "<path>/" and "<path>0" ('0' follows '/')
+        query = select(Thread).where(
+            Thread.root_id == path.split("/", 1)[0],
+            Thread.path > f"{path}/",
+            Thread.path < f"{path}0"
+        )
+        if max_depth is not None:
+            query = query.where(Thread.depth <= thread.depth + max_depth)
+        descendants = (await self.db.execute(
+            query.order_by(Thread.depth, Thread.created_at)
+        )).scalars().all()
+        
+        def to_node(t: Thread) -> Dict:
+            node = dump_trusted(ThreadResponse, t)
+            node["children"] = []
+            return node
+        
+        root = to_node(thread)
+        nodes = {thread.id: root}
+        for descendant in descendants:
+            parent_node = nodes.get(descendant.parent_thread_id)
+            if parent_node is not None:
+                node = to_node(descendant)
+                parent_node["children"].append(node)
+                nodes[descendant.id] = node
+        
+        return root
     
-    def get_children(self, thread_id: str) -> List[Thread]:
+    async def get_children(self, thread_id: str) -> List[Thread]:
         """Get all child threads of a thread"""
-        return self.db.query(Thread).filter(
-            Thread.parent_thread_id == thread_id
-        ).order_by(Thread.created_at).all()
+        return (await self.db.execute(
+            select(Thread).where(
+                Thread.parent_thread_id == thread_id
+            ).order_by(Thread.created_at)
+        )).scalars().all()
+    
+    async def delete_thread_tree(self, thread_id: str) -> Dict[str, int]:
+        """
+        Delete a thread and all of its descendants
+        
+        The subtree is collected by one recursive CTE over parent_thread_id and
+        removed with one set-based DELETE per table, in a single transaction.
+        
+        Args:
+            thread_id: Root of the subtree to delete
+        
+        Returns:
+            Number of deleted rows per table (threads, messages, contexts, jobs)
+        """
+        # nesting=True renders the CTE inside the IN subquery, so each statement
+        # still starts with DELETE and the driver reports its rowcount
+        subtree = select(Thread.id).where(Thread.id == thread_id).cte(
+            "subtree", recursive=True, nesting=True
+        )
+        subtree = subtree.union_all(
+            select(Thread.id).where(Thread.parent_thread_id == subtree.c.id)
+        )
+        subtree_ids = select(subtree.c.id)
+        
+        # Threads go last: the CTE is evaluated against the threads table
+        no_sync = {"synchronize_session": False}
+        await self.db.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.thread_id.in_(subtree_ids)), execution_options=no_sync
+        )
+        await self.db.execute(
+            delete(PrefixSummary).where(PrefixSummary.thread_id.in_(subtree_ids)), execution_options=no_sync
+        )
+        jobs = await self.db.execute(
+            delete(LLMJob).where(LLMJob.thread_id.in_(subtree_ids)), execution_options=no_sync
+        )
+        messages = await self.db.execute(
+            delete(Message).where(Message.thread_id.in_(subtree_ids)), execution_options=no_sync
+        )
+        contexts = await self.db.execute(
+            delete(ThreadContext).where(ThreadContext.thread_id.in_(subtree_ids)), execution_options=no_sync
+        )
+        threads = await self.db.execute(
+            delete(Thread).where(Thread.id.in_(subtree_ids)), execution_options=no_sync
+        )
+        await self.db.commit()
+        
+        return {
+            "threads": threads.rowcount,
+            "messages": messages.rowcount,
+            "contexts": contexts.rowcount,
+            "jobs": jobs.rowcount
+        }
     
-    def get_threads_by_depth(self, depth: Optional[int] = None) -> List[Thread]:
+    async def get_threads_by_depth(self, depth: Optional[int] = None) -> List[Thread]:
         """
         Get threads, optionally filtered by depth
         
@@ -155,12 +296,10 @@ class ThreadService:
         Returns:
             List of Thread objects
         """
-        query = self.db.query(Thread)
-        if depth is not None:
-            query = query.filter(Thread.depth == depth)
-        return query.order_by(Thread.created_at.desc()).all()
+        threads, _ = await self.get_threads_page(depth=depth)
+        return threads
     
-    def get_threads_by_types(self, types: List[ThreadType]) -> List[Thread]:
+    async def get_threads_by_types(self, types: List[ThreadType]) -> List[Thread]:
         """
         Get threads filtered by thread types
         
@@ -170,74 +309,190 @@ class ThreadService:
         Returns:
             List of Thread objects
         """
-        return self.db.query(Thread).filter(
-            Thread.thread_type.in_(types)
-        ).order_by(Thread.created_at.desc()).all()
+        threads, _ = await self.get_threads_page(types=types)
+        return threads
     
-    def get_messages_with_branches(self, thread_id: str) -> List[Dict]:
+    async def get_threads_page(
+        self,
+        depth: Optional[int] = None,
+        types: Optional[List[ThreadType]] = None,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> Tuple[List[Thread], bool]:
+        """
+        Get a page of threads, newest first, using keyset pagination
+        
+        Args:
+            depth: Optional depth filter
+            types: Optional thread type filter
+            limit: Optional page size (all matching threads if None)
+            before: Cursor; return threads older than it
+            after: Cursor; return threads newer than it
+        
+        Returns:
+            Tuple of (threads newest first, whether more threads exist in the paging direction)
+        
+        Raises:
+            ValueError: If a cursor is malformed
+        """
+        query = select(Thread)
+        if depth is not None:
+            query = query.where(Thread.depth == depth)
+        if types:
+            query = query.where(Thread.thread_type.in_(types))
+        
+        key = tuple_(Thread.created_at, Thread.id)
+        newest_first = (Thread.created_at.desc(), Thread.id.desc())
+        if after:
+            # Walk towards newer threads, then restore newest-first order
+            query = query.where(key > tuple_(*self.decode_thread_cursor(after)))
+            query = query.order_by(Thread.created_at, Thread.id)
+        else:
+            if before:
+                query = query.where(key < tuple_(*self.decode_thread_cursor(before)))
+            query = query.order_by(*newest_first)
+        
+        if limit is not None:
+            query = query.limit(limit + 1)
+        threads = list((await self.db.execute(query)).scalars().all())
+        
+        has_more = limit is not None and len(threads) > limit
+        threads = threads[:limit] if limit is not None else threads
+        if after:
+            threads.reverse()
+        return threads, has_more
+    
+    @staticmethod
+    def encode_thread_cursor(thread: Thread) -> str:
+        """Opaque keyset cursor for a thread's (created_at, id) position"""
+        raw = f"{thread.created_at.isoformat()}|{thread.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+    
+    @staticmethod
+    def decode_thread_cursor(cursor: str) -> Tuple[datetime, str]:
+        """Decode a cursor from encode_thread_cursor into (created_at, id)"""
+        try:
+            created_at, thread_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+            return datetime.fromisoformat(created_at), thread_id
+        except ValueError:
+            raise ValueError("Invalid thread cursor")
+    
+    async def get_messages_with_branches(self, thread_id: str) -> List[Dict]:
         """
         Get messages for a thread with branch information
         
         Returns:
             List of message dicts with branch metadata
         """
-        messages = self.db.query(Message).filter(
-            Message.thread_id == thread_id
-        ).order_by(Message.sequence).all()
-        
-        # Get all child threads
-        children = self.get_children(thread_id)
-        
-        # Build map of message_id -> list of child threads
-        message_branches = {}
-        for child in children:
-            if child.branch_from_message_id:
-                if child.branch_from_message_id not in message_branches:
-                    message_branches[child.branch_from_message_id] = []
-                message_branches[child.branch_from_message_id].append(child)
-        
-        # Augment messages with branch and fork info
+        messages, _ = await self.get_messages_page(thread_id)
+        return messages
+    
+    async def get_messages_page(
+        self,
+        thread_id: str,
+        limit: Optional[int] = None,
+        before_sequence: Optional[int] = None,
+        after_sequence: Optional[int] = None
+    ) -> Tuple[List[Dict], bool]:
+        """
+        Get a window of messages with branch information, using sequence cursors
+        
+        Without a cursor and with a limit, the latest messages are returned.
+        
+        Args:
+            thread_id: Thread ID
+            limit: Optional window size (whole history if None)
+            before_sequence: Return messages before this sequence (older)
+            after_sequence: Return messages after this sequence (newer)
+        
+        Returns:
+            Tuple of (message dicts in sequence order, whether more messages
+            exist in the paging direction)
+        """
+        # Usually already loaded by the caller: served from the identity map
+        thread = await self.db.get(Thread, thread_id)
+        if not thread:
+            return [], False
+        segments = await self.history.get_segments(thread)
+        
+        # Message window as a subquery, joined to the child threads branching from
+        # each message: one query, plain row tuples instead of ORM objects
+        window = self.history.build_query(
+            segments,
+            up_to_sequence=before_sequence - 1 if before_sequence is not None else None,
+            after_sequence=after_sequence,
+            limit=limit + 1 if limit is not None else None,
+            from_end=after_sequence is None,
+            columns=self._MESSAGE_COLUMNS
+        ).subquery("message_window")
+        rows = (await self.db.execute(
+            select(
+                window,
+                Thread.id.label("child_id"),
+                Thread.title.label("child_title"),
+                Thread.thread_type.label("child_type"),
+                Thread.branch_context_text.label("child_context_text"),
+                Thread.branch_text_start_offset.label("child_start_offset"),
+                Thread.branch_text_end_offset.label("child_end_offset")
+            ).outerjoin(
+                Thread,
+                and_(
+                    Thread.parent_thread_id == thread_id,
+                    Thread.branch_from_message_id == window.c.id
+                )
+            ).order_by(window.c.sequence, Thread.created_at)
+        )).all()
+        
+        # Rows arrive grouped by message; fold child rows into branches and forks
         result = []
-        for msg in messages:
-            # Separate branches (highlight-based) from forks
-            highlight_branches = [c for c in message_branches.get(msg.id, []) if c.thread_type != ThreadType.FORK]
-            forks = [c for c in message_branches.get(msg.id, []) if c.thread_type == ThreadType.FORK]
+        for row in rows:
+            if not result or result[-1]["id"] != row.id:
+                result.append({
+                    "id": row.id,
+                    "thread_id": row.thread_id,
+                    "role": row.role,
+                    "content": row.content,
+                    "sequence": row.sequence,
+                    "timestamp": row.timestamp,
+                    "model": row.model,
+                    "provider": row.provider,
+                    "tokens_used": row.tokens_used,
+                    "response_metadata": row.response_metadata,
+                    "has_branches": False,
+                    "branch_count": 0,
+                    "branches": [],
+                    "has_forks": False,
+                    "forks": []
+                })
+            if row.child_id is None:
+                continue
             
-            msg_dict = {
-                "id": msg.id,
-                "thread_id": msg.thread_id,
-                "role": msg.role,
-                "content": msg.content,
-                "sequence": msg.sequence,
-                "timestamp": msg.timestamp,
-                "model": msg.model,
-                "provider": msg.provider,
-                "tokens_used": msg.tokens_used,
-                "response_metadata": msg.response_metadata,
-                "has_branches": len(highlight_branches) > 0,
-                "branch_count": len(highlight_branches),
-                "branches": [
-                    {
-                        "thread_id": child.id,
-                        "title": child.title,
-                        "branch_context_text": child.branch_context_text,
-                        "branch_text_start_offset": child.branch_text_start_offset,
-                        "branch_text_end_offset": child.branch_text_end_offset
-                    }
-                    for child in highlight_branches
-                ],
-                "has_forks": len(forks) > 0,
-                "forks": [
-                    {
-                        "thread_id": fork.id,
-                        "title": fork.title
-                    }
-                    for fork in forks
-                ]
-            }
-            result.append(msg_dict)
-        
-        return result
+            # Separate branches (highlight-based) from forks
+            msg_dict = result[-1]
+            if row.child_type == ThreadType.FORK:
+                msg_dict["has_forks"] = True
+                msg_dict["forks"].append({
+                    "thread_id": row.child_id,
+                    "title": row.child_title
+                })
+            else:
+                msg_dict["has_branches"] = True
+                msg_dict["branch_count"] += 1
+                msg_dict["branches"].append({
+                    "thread_id": row.child_id,
+                    "title": row.child_title,
+                    "branch_context_text": row.child_context_text,
+                    "branch_text_start_offset": row.child_start_offset,
+                    "branch_text_end_offset": row.child_end_offset
+                })
+        
+        has_more = limit is not None and len(result) > limit
+        if has_more:
+            # The extra message sits at the far end of the paging direction
+            result = result[:limit] if after_sequence is not None else result[1:]
+        
+        return result, has_more
     
     async def generate_thread_title(self, thread_id: str, from_last_user_message: bool = False) -> str:
         """
@@ -250,19 +505,18 @@ class ThreadService:
         Returns:
             Generated title
         """
+        thread = await self.get_thread(thread_id)
+        if not thread:
+            return "New Thread"
+        
         # Get user message(s)
-        if from_last_user_message:
-            # For forks: use the last user message (the first NEW message in the fork)
-            message = self.db.query(Message).filter(
-                Message.thread_id == thread_id,
-                Message.role == MessageRole.USER
-            ).order_by(Message.sequence.desc()).first()
-        else:
-            # For new threads: use the first user message
-            message = self.db.query(Message).filter(
-                Message.thread_id == thread_id,
-                Message.role == MessageRole.USER
-            ).order_by(Message.sequence).first()
+        # For forks: use the last user message (the first NEW message in the fork)
+        # For new threads: use the first user message
+        message = await self.history.get_last_message(
+            thread,
+            role=MessageRole.USER,
+            first=not from_last_user_message
+        )
         
         if not message:
             return "New Thread"
@@ -283,10 +537,53 @@ class ThreadService:
             force: If True, update title even if it's already set (for forks)
             from_last_user_message: If True, use last user message for title generation (for forks)
         """
-        thread = self.get_thread(thread_id)
+        thread = await self.get_thread(thread_id)
         if thread:
             if force or not thread.title:
                 title = await self.generate_thread_title(thread_id, from_last_user_message=from_last_user_message)
                 thread.title = title
-                self.db.commit()
-
+                await self.db.commit()
+    
+    @staticmethod
+    def new_assistant_message(
+        thread_id: str,
+        sequence: int,
+        provider_name: str,
+        content: str,
+        tokens_used: int,
+        metadata: Dict
+    ) -> Message:
+        """Build an assistant message with its token and branching metadata"""
+        return Message(
+            thread_id=thread_id,
+            role=MessageRole.ASSISTANT,
+            content=content,
+            sequence=sequence,
+            model=metadata.get("model"),
+            provider=provider_name,
+            tokens_used=tokens_used,
+            response_metadata=metadata,
+            openai_response_id=metadata.get("response_id"),  # Store for branching
+            # The provider's count when it reports one, an estimate otherwise
+            token_count=metadata.get("output_tokens") or estimate_tokens(content)
+        )
+    
+    async def save_assistant_message(
+        self,
+        thread_id: str,
+        sequence: int,
+        provider_name: str,
+        content: str,
+        tokens_used: int,
+        metadata: Dict
+    ) -> Message:
+        """Persist an assistant response and add its tokens to the usage rollups"""
+        assistant_message = self.new_assistant_message(
+            thread_id, sequence, provider_name, content, tokens_used, metadata
+        )
+        self.db.add(assistant_message)
+        await UsageRollup(self.db).record_response(thread_id, provider_name, tokens_used, metadata)
+        await self.db.commit()
+        await self.db.refresh(assistant_message)
+        
+        return assistant_message
@@ -0,0 +1,13 @@
+# Rough token estimates for context budgeting, stored with each message at
+# write time. About four characters per token for English text; exact counts
+# are provider- and model-specific and not needed to stay inside a budget.
+
+CHARS_PER_TOKEN = 4
+
+# Role and formatting tokens added per message in a chat request
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -0,0 +1,129 @@
+from typing import Dict, List, Optional
+from datetime import datetime, date
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models import Thread, TokenUsage
+
+# Row key for all-time totals
+ALL_TIME = "*"
+
+COUNTERS = ("requests", "input_tokens", "output_tokens", "total_tokens")
+
+
+class UsageRollup:
+    """
+    Token usage rollups per thread, root tree, provider/model and day
+    
+    Every LLM call adds its tokens to the thread, tree, model and overall
+    rows for its day and for all time, with one upsert executed in the
+    caller's transaction: the rollups commit (or roll back) together with
+    the message or summary they account for. Reads are primary-key lookups.
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    @staticmethod
+    def model_key(provider: Optional[str], model: Optional[str]) -> str:
+        return f"{provider or 'unknown'}/{model or 'unknown'}"
+    
+    async def record(
+        self,
+        thread_id: str,
+        provider: Optional[str],
+        model: Optional[str],
+        total_tokens: int,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        at: Optional[datetime] = None
+    ):
+        """
+        Add one LLM call to the rollups (not committed)
+        
+        Args:
+            thread_id: Thread the call was made for
+            provider: Provider name
+            model: Model name
+            total_tokens: Tokens billed for the call
+            input_tokens: Prompt tokens, when the provider reports them
+            output_tokens: Completion tokens, when the provider reports them
+            at: Time of the call (default: now)
+        """
+        root_id = (await self.db.execute(
+            select(Thread.root_id).where(Thread.id == thread_id)
+        )).scalar() or thread_id
+        day = (at or datetime.utcnow()).date().isoformat()
+        
+        increments = {
+            "requests": 1,
+            "input_tokens": input_tokens or 0,
+            "output_tokens": output_tokens or 0,
+            "total_tokens": total_tokens or 0,
+        }
+        now = datetime.utcnow()
+        rows = [
+            {"scope": scope, "key": key, "day": d, "updated_at": now, **increments}
+            for scope, key in (
+                ("thread", thread_id),
+                ("tree", root_id),
+                ("model", self.model_key(provider, model)),
+                ("total", "all"),
+            )
+            for d in (day, ALL_TIME)
+        ]
+        statement = insert(TokenUsage).values(rows)
+        await self.db.execute(statement.on_conflict_do_update(
+            index_elements=["scope", "key", "day"],
+            set_={
+                **{name: getattr(TokenUsage, name) + getattr(statement.excluded, name) for name in COUNTERS},
+                "updated_at": statement.excluded.updated_at,
+            }
+        ))
+    
+    async def record_response(self, thread_id: str, provider: str, tokens_used: int, metadata: Dict):
+        """Add an LLM response (send_message result) to the rollups (not committed)"""
+        # Cache hits cost nothing; their metadata describes the original call
+        billed = not metadata.get("cache_hit")
+        await self.record(
+            thread_id,
+            provider,
+            metadata.get("model"),
+            tokens_used,
+            input_tokens=metadata.get("input_tokens", 0) if billed else 0,
+            output_tokens=metadata.get("output_tokens", 0) if billed else 0
+        )
+    
+    async def get_total(self, scope: str, key: str) -> Dict:
+        """All-time totals of one rollup"""
+        row = await self.db.get(TokenUsage, (scope, key, ALL_TIME))
+        return {name: getattr(row, name) if row else 0 for name in COUNTERS}
+    
+    async def get_days(
+        self,
+        scope: str,
+        key: str,
+        since: Optional[date] = None,
+        until: Optional[date] = None
+    ) -> List[Dict]:
+        """Daily totals of one rollup, oldest first, optionally within [since, until]"""
+        query = select(TokenUsage).where(
+            TokenUsage.scope == scope,
+            TokenUsage.key == key,
+            TokenUsage.day != ALL_TIME
+        )
+        if since:
+            query = query.where(TokenUsage.day >= since.isoformat())
+        if until:
+            query = query.where(TokenUsage.day <= until.isoformat())
+        rows = (await self.db.execute(query.order_by(TokenUsage.day))).scalars().all()
+        return [{"day": row.day, **{name: getattr(row, name) for name in COUNTERS}} for row in rows]
+    
+    async def get_keys(self, scope: str) -> List[Dict]:
+        """All-time totals of every rollup in a scope (e.g. every model)"""
+        rows = (await self.db.execute(
+            select(TokenUsage)
+            .where(TokenUsage.scope == scope, TokenUsage.day == ALL_TIME)
+            .order_by(TokenUsage.total_tokens.desc())
+        )).scalars().all()
+        return [{"key": row.key, **{name: getattr(row, name) for name in COUNTERS}} for row in rows]
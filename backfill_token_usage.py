@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Rebuild the token_usage rollups from existing data:
+1. Every assistant message counts as one LLM call (cache hits count as
+   calls without input/output tokens, as they do when recorded live)
+2. Every cached prefix summary counts as one summarization call, under
+   the configured SUMMARIZATION_PROVIDER / SUMMARIZATION_MODEL key that live
+   summaries are recorded under (summaries store no provider or model, so
+   ones made with an earlier configuration are attributed to the current one)
+
+Sibling-summary reduce calls were never persisted and cannot be recovered.
+The table is cleared and rebuilt, so this is safe to run multiple times;
+stop the backend first so no calls are recorded while it runs.
+"""
+
+import sqlite3
+import os
+
+from backend.config import settings
+from backend.services.usage import UsageRollup
+
+DB_PATH = 'thought_partner.db'
+
+# One row per LLM call: thread, tree, model key, day, input/output/total tokens
+CALLS = """
+    SELECT m.thread_id,
+           COALESCE(t.root_id, m.thread_id),
+           COALESCE(m.provider, 'unknown') || '/' || COALESCE(m.model, 'unknown'),
+           date(m.timestamp),
+           CASE WHEN json_extract(m.response_metadata, '$.cache_hit') THEN 0
+                ELSE COALESCE(json_extract(m.response_metadata, '$.input_tokens'), 0) END,
+           CASE WHEN json_extract(m.response_metadata, '$.cache_hit') THEN 0
+                ELSE COALESCE(json_extract(m.response_metadata, '$.output_tokens'), 0) END,
+           COALESCE(m.tokens_used, 0)
+    FROM messages m LEFT JOIN threads t ON t.id = m.thread_id
+    WHERE m.role = 'ASSISTANT'
+    UNION ALL
+    SELECT p.thread_id,
+           COALESCE(t.root_id, p.thread_id),
+           :summary_model_key,
+           date(p.created_at),
+           0,
+           0,
+           COALESCE(p.tokens_used, 0)
+    FROM prefix_summaries p LEFT JOIN threads t ON t.id = p.thread_id
+"""
+
+def main():
+    if not os.path.exists(DB_PATH):
+        print(f"Database {DB_PATH} not found. Nothing to backfill.")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='token_usage'")
+        if cursor.fetchone() is None:
+            print("Table token_usage not found. Start the backend once to create it, then re-run.")
+            return
+
+        summary_model_key = UsageRollup.model_key(settings.summarization_provider, settings.summarization_model)
+
+        print("Clearing token_usage...")
+        cursor.execute("DELETE FROM token_usage")
+
+        print("Rebuilding rollups...")
+        for scope, key_column in (("thread", "thread_id"), ("tree", "root_id"), ("model", "model_key"), ("total", "'all'")):
+            for day_column in ("day", "'*'"):
+                cursor.execute(f"""
+                    INSERT INTO token_usage
+                        (scope, key, day, requests, input_tokens, output_tokens, total_tokens, updated_at)
+                    WITH calls(thread_id, root_id, model_key, day, input_tokens, output_tokens, total_tokens)
+                        AS ({CALLS})
+                    SELECT '{scope}', {key_column}, {day_column}, COUNT(*),
+                           SUM(input_tokens), SUM(output_tokens), SUM(total_tokens), datetime('now')
+                    FROM calls
+                    GROUP BY 2, 3
+                """, {"summary_model_key": summary_model_key})
+                print(f"  {scope} ({'daily' if day_column == 'day' else 'all-time'}): {cursor.rowcount} rows")
+        conn.commit()
+
+        print("\nBackfill completed successfully!")
+
+    except Exception as e:
+        print(f"Error during backfill: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
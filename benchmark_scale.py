@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Benchmark ThreadService and context assembly on large synthetic databases:
+1. get_messages_with_branches for threads at every depth (forks included)
+2. get_threads_by_depth(0), the root thread listing
+3. create_thread(is_fork=True) from a random assistant message
+4. delete_thread_tree of a depth-1 subtree
+5. _assemble_llm_context for the deepest threads
+
+Each size gets a dataset from generate_dataset.py (kept in --data-dir and
+reused on later runs with the same parameters). Operations run against a
+scratch copy, since creating and deleting threads changes it. Results are
+printed and written as JSON, to compare schema and query changes.
+
+Usage: python benchmark_scale.py [--sizes 10000 100000 1000000] [--runs 50] [--output benchmark_scale_results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from backend.api.messages import _assemble_llm_context
+from backend.database import _configure_sqlite
+from backend.models import Thread, Message, MessageRole
+from backend.services.thread_service import ThreadService
+from generate_dataset import generate, roots_for
+
+
+async def time_operation(
+    session_factory,
+    name: str,
+    runs: int,
+    operation: Callable[[AsyncSession, int], Awaitable]
+) -> Dict:
+    """Run operation(db, i) `runs` times, each in a fresh session, and summarize the timings"""
+    timings = []
+    for i in range(runs):
+        async with session_factory() as db:
+            started = time.perf_counter()
+            await operation(db, i)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "operation": name,
+        "runs": runs,
+        "min_ms": timings[0],
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "max_ms": timings[-1],
+    }
+
+
+async def benchmark_database(db_path: str, runs: int) -> List[Dict]:
+    """Time every operation against one database"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=AsyncAdaptedQueuePool)
+    _configure_sqlite(engine)
+    session_factory = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+    async with session_factory() as db:
+        threads = (await db.execute(select(Thread.id, Thread.depth))).all()
+        max_depth = max(depth for _, depth in threads)
+
+        # Sample threads up front so the timed operations only run the code under test
+        def sample(ids: List[str]) -> List[str]:
+            return random.sample(ids, min(runs, len(ids)))
+
+        any_threads = sample([t for t, _ in threads])
+        deepest = sample([t for t, d in threads if d == max_depth])
+        subtrees = sample([t for t, d in threads if d == 1])
+        fork_points = (await db.execute(
+            select(Message.thread_id, Message.id)
+            .where(Message.role == MessageRole.ASSISTANT, Message.thread_id.in_(any_threads))
+        )).all()
+
+    async def messages_with_branches(db, i):
+        await ThreadService(db).get_messages_with_branches(any_threads[i % len(any_threads)])
+
+    async def threads_by_depth(db, i):
+        await ThreadService(db).get_threads_by_depth(0)
+
+    async def create_fork(db, i):
+        thread_id, message_id = fork_points[i % len(fork_points)]
+        await ThreadService(db).create_thread(
+            parent_thread_id=thread_id, branch_from_message_id=message_id, is_fork=True
+        )
+
+    async def delete_subtree(db, i):
+        await ThreadService(db).delete_thread_tree(subtrees[i % len(subtrees)])
+
+    async def assemble_context(db, i):
+        thread = await ThreadService(db).get_thread(deepest[i % len(deepest)])
+        await _assemble_llm_context(db, thread, None)
+
+    results = []
+    try:
+        for name, operation, count in (
+            ("get_messages_with_branches", messages_with_branches, runs),
+            ("get_threads_by_depth(0)", threads_by_depth, runs),
+            ("create_thread(is_fork=True)", create_fork, runs),
+            ("_assemble_llm_context", assemble_context, runs),
+            # Each run removes a different subtree
+            ("delete_thread_tree", delete_subtree, min(runs, len(subtrees))),
+        ):
+            results.append(await time_operation(session_factory, name, count, operation))
+    finally:
+        await engine.dispose()
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thread operations on large synthetic databases")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="Message counts")
+    parser.add_argument("--runs", type=int, default=50, help="Timed runs per operation")
+    parser.add_argument("--branching", type=int, default=3)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--messages-per-thread", type=int, default=20)
+    parser.add_argument("--fork-ratio", type=float, default=0.3)
+    parser.add_argument("--data-dir", default="benchmark_data", help="Where datasets are kept between runs")
+    parser.add_argument("--regenerate", action="store_true", help="Rebuild datasets even if present")
+    parser.add_argument("--output", default="benchmark_scale_results.json")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = {
+        "generated_at": datetime.utcnow().isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "runs": args.runs,
+        "datasets": [],
+        "results": [],
+    }
+
+    for size in args.sizes:
+        roots = roots_for(size, args.branching, args.depth, args.messages_per_thread)
+        name = f"dataset_{size}_b{args.branching}_d{args.depth}_m{args.messages_per_thread}_f{args.fork_ratio}.db"
+        dataset_path = os.path.join(args.data_dir, name)
+        meta_path = dataset_path + ".json"
+
+        if args.regenerate or not os.path.exists(meta_path):
+            print(f"Generating {size} messages ({roots} roots)...")
+            stats = generate(
+                dataset_path,
+                roots,
+                branching=args.branching,
+                depth=args.depth,
+                messages_per_thread=args.messages_per_thread,
+                fork_ratio=args.fork_ratio
+            )
+            with open(meta_path, "w") as f:
+                json.dump(stats, f)
+            print(f"  {stats['threads']} threads, {stats['messages']} messages in {stats['seconds']:.1f} s")
+        with open(meta_path) as f:
+            stats = json.load(f)
+        report["datasets"].append({"size": size, **stats})
+
+        work_path = os.path.join(args.data_dir, "work.db")
+        shutil.copyfile(dataset_path, work_path)
+        random.seed(size)
+        try:
+            print(f"Benchmarking {stats['messages']} messages / {stats['threads']} threads:")
+            for result in asyncio.run(benchmark_database(work_path, args.runs)):
+                result = {"size": size, "messages": stats["messages"], "threads": stats["threads"], **result}
+                report["results"].append(result)
+                print(f"  {result['operation']:30} median {result['median_ms']:9.2f} ms   "
+                      f"p95 {result['p95_ms']:9.2f} ms   max {result['max_ms']:9.2f} ms")
+        finally:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(work_path + suffix):
+                    os.remove(work_path + suffix)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark response serialization for a message history page:
+1. Before: Pydantic from_attributes validation + jsonable_encoder + json.dumps
+   (what FastAPI does for a response_model route returning ORM objects)
+2. After: dump_trusted() + orjson.dumps (what the API routes do now)
+
+Usage: python benchmark_serialization.py [message_count] [rounds]
+"""
+
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from backend.models import MessageRole
+from backend.schemas import MessageResponse, dump_trusted
+
+
+def make_messages(count: int) -> List[SimpleNamespace]:
+    """Build ORM-like message objects with realistic content sizes"""
+    started = datetime.utcnow()
+    thread_id = str(uuid.uuid4())
+    messages = []
+    for i in range(count):
+        role = MessageRole.USER if i % 2 == 0 else MessageRole.ASSISTANT
+        messages.append(SimpleNamespace(
+            id=str(uuid.uuid4()),
+            thread_id=thread_id,
+            role=role,
+            content=("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * (4 if role == MessageRole.USER else 30)),
+            sequence=i + 1,
+            timestamp=started + timedelta(seconds=i),
+            model="gpt-4o" if role == MessageRole.ASSISTANT else None,
+            provider="openai" if role == MessageRole.ASSISTANT else None,
+            tokens_used=450 if role == MessageRole.ASSISTANT else None,
+            response_metadata={"response_id": f"resp_{i}", "status": "completed"} if role == MessageRole.ASSISTANT else None,
+            has_branches=i % 7 == 0,
+            branch_count=1 if i % 7 == 0 else 0,
+            has_forks=False,
+            forks=None
+        ))
+    return messages
+
+
+def serialize_before(messages) -> bytes:
+    adapter = TypeAdapter(List[MessageResponse])
+    validated = adapter.validate_python(messages, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def serialize_after(messages) -> bytes:
+    return orjson.dumps([dump_trusted(MessageResponse, m) for m in messages])
+
+
+def best_of(fn, messages, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn(messages)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    messages = make_messages(count)
+
+    # Both paths must produce the same document
+    assert json.loads(serialize_before(messages)) == json.loads(serialize_after(messages))
+
+    before = best_of(serialize_before, messages, rounds)
+    after = best_of(serialize_after, messages, rounds)
+
+    print(f"Serializing {count} messages (best of {rounds}):")
+    print(f"  before (pydantic + jsonable_encoder + json): {before * 1000:8.2f} ms")
+    print(f"  after  (dump_trusted + orjson):              {after * 1000:8.2f} ms")
+    print(f"  speedup: {before / after:.1f}x")
+
+if __name__ == '__main__':
+    main()
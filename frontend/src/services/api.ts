@@ -1,6 +1,6 @@
 import axios from 'axios';
 import { Thread, ThreadCreate } from '../types/thread';
-import { Message, MessageCreate } from '../types/message';
+import { Job, Message, MessageCreate } from '../types/message';
 
 const API_BASE_URL = 'http://localhost:8000';
 
@@ -55,13 +55,45 @@ export const messagesApi = {
     return response.data;
   },
 
-  // Send a message and get response
+  // Send a message and get response (background sends wait for their job to finish)
   sendMessage: async (threadId: string, data: MessageCreate, background: boolean = false): Promise<Message> => {
-    const response = await api.post<Message>(`/threads/${threadId}/messages`, { ...data, background });
-    return response.data;
+    const response = await api.post<Message | Job>(`/threads/${threadId}/messages`, { ...data, background });
+    if (response.status === 202) {
+      const job = response.data as Job;
+      return jobsApi.waitForJob(response.headers['location'] || `/jobs/${job.id}`);
+    }
+    return response.data as Message;
   },
 };
 
+export const jobsApi = {
+  // Follow a background job's events until its assistant message is saved
+  waitForJob: (jobLocation: string): Promise<Message> =>
+    new Promise((resolve, reject) => {
+      const events = new EventSource(`${API_BASE_URL}${jobLocation}/events`);
+      events.addEventListener('message', (event) => {
+        events.close();
+        const message = JSON.parse((event as MessageEvent).data);
+        if (message) {
+          resolve(message);
+        } else {
+          reject(new Error('The response was deleted'));
+        }
+      });
+      events.addEventListener('error', (event) => {
+        const data = (event as MessageEvent).data;
+        if (data) {
+          // Job failed
+          events.close();
+          reject(new Error(JSON.parse(data).detail || 'Background request failed'));
+        } else if (events.readyState === EventSource.CLOSED) {
+          // Connection failed for good (dropped connections are retried by EventSource)
+          reject(new Error('Lost connection while waiting for the response'));
+        }
+      });
+    }),
+};
+
 export const contextApi = {
   // Get thread context
   getContext: async (threadId: string) => {
@@ -32,6 +32,21 @@ export interface BranchInfo {
   branch_text_end_offset?: number | null;
 }
 
+export type JobStatus = 'queued' | 'in_progress' | 'completed' | 'failed';
+
+export interface Job {
+  id: string;
+  thread_id: string;
+  status: JobStatus;
+  provider: string;
+  model: string | null;
+  sequence: number;
+  error: string | null;
+  created_at: string;
+  updated_at: string;
+  message: Message | null;
+}
+
 export interface MessageCreate {
   content: string;
   provider?: string;
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic conversation database for benchmarks.
+
+Builds N root threads, each with a tree of branches and copy-on-write forks
+(branching factor children per thread, down to depth), and messages per
+thread alternating user / assistant. Rows are bulk-inserted with sqlite3
+into a fresh file with the application schema, so a million messages take
+well under a minute.
+
+Usage:
+    python generate_dataset.py --messages 100000 [--db dataset.db]
+    python generate_dataset.py --roots 50 --branching 3 --depth 2 --messages-per-thread 20
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine
+
+from backend.database import Base
+from backend import models  # noqa: F401 - registers the tables on Base
+
+# Rows per executemany call
+BATCH_SIZE = 10000
+
+WORDS = (
+    "the", "idea", "branch", "thread", "context", "question", "answer", "model",
+    "explore", "because", "consider", "example", "learning", "detail", "and", "so",
+)
+
+
+def threads_per_tree(branching: int, depth: int) -> int:
+    return sum(branching ** level for level in range(depth + 1))
+
+
+def roots_for(messages: int, branching: int, depth: int, messages_per_thread: int) -> int:
+    """Number of root threads needed for about `messages` messages"""
+    return max(1, round(messages / (threads_per_tree(branching, depth) * messages_per_thread)))
+
+
+def make_text(chars: int) -> str:
+    words = []
+    length = 0
+    while length < chars:
+        word = random.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+class DatasetWriter:
+    """Buffers thread and message rows and inserts them in batches"""
+
+    def __init__(self, conn: sqlite3.Connection, user_chars: int, assistant_chars: int):
+        self.conn = conn
+        self.user_chars = user_chars
+        self.assistant_chars = assistant_chars
+        self.clock = datetime.utcnow() - timedelta(days=365)
+        self.threads: List[tuple] = []
+        self.messages: List[tuple] = []
+        self.thread_count = 0
+        self.message_count = 0
+        # A few distinct texts per role keep generation fast; sizes are what matter
+        self.texts = {
+            "USER": [make_text(user_chars) for _ in range(50)],
+            "ASSISTANT": [make_text(assistant_chars) for _ in range(50)],
+        }
+
+    def tick(self) -> str:
+        self.clock += timedelta(seconds=random.randint(1, 30))
+        return self.clock.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+    def add_thread(
+        self,
+        parent: Optional[Dict],
+        messages_per_thread: int,
+        fork: bool = False
+    ) -> Dict:
+        """Add a thread (root, or a branch / fork of parent) with its messages"""
+        thread_id = str(uuid.uuid4())
+        branch_message = random.choice(parent["assistant_messages"]) if parent else None
+        first_sequence = 1
+
+        if parent is None:
+            thread_type, depth, root_id, path = "ROOT", 0, thread_id, thread_id
+        else:
+            thread_type = "FORK" if fork else "BRANCH"
+            depth = parent["depth"] + 1
+            root_id = parent["root_id"]
+            path = f"{parent['path']}/{thread_id}"
+            if fork:
+                # Inherits the parent's messages up to the fork point
+                first_sequence = branch_message["sequence"] + 1
+
+        context_text = None
+        if parent is not None and not fork:
+            context_text = self.texts["ASSISTANT"][0][:40]
+
+        self.threads.append((
+            thread_id,
+            parent["id"] if parent else None,
+            depth,
+            self.tick(),
+            f"Thread {self.thread_count}",
+            thread_type,
+            branch_message["id"] if branch_message else None,
+            context_text,
+            0 if context_text else None,
+            40 if context_text else None,
+            branch_message["sequence"] if fork else None,
+            root_id,
+            path,
+        ))
+        self.thread_count += 1
+
+        assistant_messages = []
+        for offset in range(messages_per_thread):
+            sequence = first_sequence + offset
+            role = "USER" if offset % 2 == 0 else "ASSISTANT"
+            message_id = str(uuid.uuid4())
+            content = random.choice(self.texts[role])
+            token_count = (len(content) + 3) // 4
+            assistant = role == "ASSISTANT"
+            self.messages.append((
+                message_id,
+                thread_id,
+                role,
+                content,
+                sequence,
+                self.tick(),
+                "gpt-4o" if assistant else None,
+                "openai" if assistant else None,
+                token_count * 3 if assistant else None,
+                json.dumps({"model": "gpt-4o", "status": "completed", "output_tokens": token_count}) if assistant else None,
+                token_count,
+            ))
+            if assistant:
+                assistant_messages.append({"id": message_id, "sequence": sequence})
+        self.message_count += messages_per_thread
+
+        if len(self.messages) >= BATCH_SIZE:
+            self.flush()
+
+        return {
+            "id": thread_id,
+            "depth": depth,
+            "root_id": root_id,
+            "path": path,
+            "assistant_messages": assistant_messages,
+        }
+
+    def flush(self):
+        self.conn.executemany(
+            "INSERT INTO threads (id, parent_thread_id, depth, created_at, title, thread_type, "
+            "branch_from_message_id, branch_context_text, branch_text_start_offset, "
+            "branch_text_end_offset, fork_sequence, root_id, path) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self.threads
+        )
+        self.conn.executemany(
+            "INSERT INTO messages (id, thread_id, role, content, sequence, timestamp, model, "
+            "provider, tokens_used, response_metadata, token_count) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self.messages
+        )
+        self.threads.clear()
+        self.messages.clear()
+
+
+def generate(
+    db_path: str,
+    roots: int,
+    branching: int = 3,
+    depth: int = 2,
+    messages_per_thread: int = 20,
+    fork_ratio: float = 0.3,
+    user_chars: int = 120,
+    assistant_chars: int = 600,
+    seed: Optional[int] = 0
+) -> Dict:
+    """
+    Create a fresh database at db_path filled with synthetic conversation trees
+
+    Returns:
+        Dict with the generation parameters, row counts and elapsed seconds
+    """
+    random.seed(seed)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    started = time.perf_counter()
+    schema_engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(schema_engine)
+    schema_engine.dispose()
+
+    conn = sqlite3.connect(db_path)
+    # Bulk load: no rollback journal or fsyncs; the file is thrown away on failure
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    writer = DatasetWriter(conn, user_chars, assistant_chars)
+    try:
+        for _ in range(roots):
+            level = [writer.add_thread(None, messages_per_thread)]
+            for _ in range(depth):
+                level = [
+                    writer.add_thread(parent, messages_per_thread, fork=random.random() < fork_ratio)
+                    for parent in level
+                    for _ in range(branching)
+                ]
+        writer.flush()
+        conn.commit()
+        conn.execute("ANALYZE")
+        # The application runs in WAL mode
+        conn.execute("PRAGMA journal_mode=WAL")
+    finally:
+        conn.close()
+
+    return {
+        "roots": roots,
+        "branching": branching,
+        "depth": depth,
+        "messages_per_thread": messages_per_thread,
+        "fork_ratio": fork_ratio,
+        "threads": writer.thread_count,
+        "messages": writer.message_count,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic conversation database for benchmarks")
+    parser.add_argument("--db", default="dataset.db", help="Output database file (replaced if it exists)")
+    parser.add_argument("--messages", type=int, help="Target message count (sets --roots)")
+    parser.add_argument("--roots", type=int, default=10)
+    parser.add_argument("--branching", type=int, default=3, help="Children per thread")
+    parser.add_argument("--depth", type=int, default=2, help="Levels of children below each root")
+    parser.add_argument("--messages-per-thread", type=int, default=20)
+    parser.add_argument("--fork-ratio", type=float, default=0.3, help="Share of children that are forks")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    roots = args.roots
+    if args.messages:
+        roots = roots_for(args.messages, args.branching, args.depth, args.messages_per_thread)
+
+    stats = generate(
+        args.db,
+        roots,
+        branching=args.branching,
+        depth=args.depth,
+        messages_per_thread=args.messages_per_thread,
+        fork_ratio=args.fork_ratio,
+        seed=args.seed
+    )
+    print(f"Generated {stats['threads']} threads and {stats['messages']} messages "
+          f"in {args.db} ({stats['seconds']:.1f} s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Load test the backend with realistic conversation traffic.
+
+Each virtual user repeatedly:
+1. Creates a root thread and has a short conversation in it
+2. Reads the thread's messages
+3. Branches (from a text selection) or forks from an assistant message and
+   continues the conversation there
+4. Reads the thread tree, and now and then the list of root threads
+
+Run the backend with the fake provider to test without API costs, e.g.
+FAKE_LATENCY_MS=800 FAKE_FAILURE_RATE=0.01, then:
+
+Usage: python load_test.py [--users 20] [--duration 60] [--provider fake] [--output results.json]
+
+Reports throughput and p50/p95/p99 latency per endpoint.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+
+class Recorder:
+    """Latencies and errors per endpoint"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        """Send a request (reading the whole body) and record its latency under endpoint"""
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[endpoint] += 1
+            self.latencies[endpoint].append(time.perf_counter() - started)
+            return None
+        self.latencies[endpoint].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+            return None
+        return response
+
+    def report(self, elapsed: float) -> Dict:
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors[endpoint],
+                "throughput_rps": len(latencies) / elapsed,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "max_ms": latencies[-1] * 1000,
+            }
+        total = sum(e["requests"] for e in endpoints.values())
+        return {
+            "elapsed_s": elapsed,
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "throughput_rps": total / elapsed,
+            "endpoints": endpoints,
+        }
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def converse(client: httpx.AsyncClient, recorder: Recorder, args, thread_id: str, turns: int):
+    """Send a few user messages to a thread, some of them streamed"""
+    for turn in range(turns):
+        body = {"content": f"Question {turn}: tell me more about this.", "provider": args.provider}
+        if random.random() < args.stream_ratio:
+            body["stream"] = True
+            endpoint = "POST /threads/{id}/messages (stream)"
+            response = await recorder.request(client, endpoint, "POST", f"/threads/{thread_id}/messages", json=body)
+            # Failures after the first byte arrive as an error event in a 200 response
+            if response is not None and "event: error" in response.text:
+                recorder.errors[endpoint] += 1
+        else:
+            await recorder.request(client, "POST /threads/{id}/messages", "POST", f"/threads/{thread_id}/messages", json=body)
+        if args.think_time:
+            await asyncio.sleep(random.uniform(0, 2 * args.think_time))
+
+
+async def session(client: httpx.AsyncClient, recorder: Recorder, args, deadline: float):
+    """One virtual user: conversations with branches and forks until the deadline"""
+    while time.monotonic() < deadline:
+        response = await recorder.request(client, "POST /threads (root)", "POST", "/threads", json={})
+        if response is None:
+            continue
+        root_id = response.json()["id"]
+        await converse(client, recorder, args, root_id, args.messages_per_thread)
+
+        response = await recorder.request(client, "GET /threads/{id}/messages", "GET", f"/threads/{root_id}/messages")
+        assistant_messages = [
+            m for m in (response.json()["messages"] if response else [])
+            if m["role"] == "assistant"
+        ]
+
+        for _ in range(args.children_per_thread):
+            if not assistant_messages:
+                break
+            message = random.choice(assistant_messages)
+            if random.random() < args.fork_ratio:
+                endpoint = "POST /threads (fork)"
+                body = {"parent_thread_id": root_id, "branch_from_message_id": message["id"], "is_fork": True}
+            else:
+                endpoint = "POST /threads (branch)"
+                start = random.randrange(max(1, len(message["content"]) - 40))
+                body = {
+                    "parent_thread_id": root_id,
+                    "branch_from_message_id": message["id"],
+                    "branch_context_text": message["content"][start:start + 40],
+                    "branch_text_start_offset": start,
+                    "branch_text_end_offset": start + 40,
+                }
+            response = await recorder.request(client, endpoint, "POST", "/threads", json=body)
+            if response is not None:
+                await converse(client, recorder, args, response.json()["id"], max(1, args.messages_per_thread // 2))
+
+        await recorder.request(client, "GET /threads/{id}/tree", "GET", f"/threads/{root_id}/tree")
+        if random.random() < 0.2:
+            await recorder.request(client, "GET /threads", "GET", "/threads", params={"depth": 0})
+
+
+def print_report(report: Dict):
+    print(f"\n{report['requests']} requests in {report['elapsed_s']:.1f} s "
+          f"({report['throughput_rps']:.1f} req/s, {report['errors']} errors)\n")
+    print(f"{'endpoint':42} {'reqs':>6} {'errs':>5} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:42} {stats['requests']:6d} {stats['errors']:5d} {stats['throughput_rps']:7.1f} "
+              f"{stats['p50_ms']:8.1f} {stats['p95_ms']:8.1f} {stats['p99_ms']:8.1f} {stats['max_ms']:8.1f}")
+
+
+async def run(args) -> Dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*(session(client, recorder, args, deadline) for _ in range(args.users)))
+        elapsed = time.monotonic() - started
+    return recorder.report(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend with realistic conversation traffic")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to start new conversations for")
+    parser.add_argument("--provider", default="fake", help="Provider sent with every message")
+    parser.add_argument("--messages-per-thread", type=int, default=4)
+    parser.add_argument("--children-per-thread", type=int, default=2, help="Branches / forks per root thread")
+    parser.add_argument("--fork-ratio", type=float, default=0.3, help="Share of children that are forks")
+    parser.add_argument("--stream-ratio", type=float, default=0.2, help="Share of messages sent with stream=true")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between a user's messages")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    print(f"Load testing {args.base_url} with {args.users} users for {args.duration:.0f} s (provider: {args.provider})")
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Must run before backend.database is imported: it creates its engines from settings
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
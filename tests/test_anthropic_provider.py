@@ -0,0 +1,183 @@
+"""
+AnthropicProvider against a local stand-in for the Messages API
+
+Requests go through httpx.MockTransport, so the tests check the request
+bodies the SDK sends (prompt-cache breakpoints) and the token metadata
+parsed from responses without network access or an API key.
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from anthropic import AsyncAnthropic
+
+from backend.config import settings
+from backend.services.anthropic_provider import AnthropicProvider, CACHE_BREAKPOINT, CONTINUATION_PROMPT
+
+USAGE = {
+    "input_tokens": 12,
+    "output_tokens": 5,
+    "cache_read_input_tokens": 300,
+    "cache_creation_input_tokens": 50,
+}
+
+MESSAGES = [
+    {"role": "system", "content": "System prompt"},
+    {"role": "system", "content": "Summary of the parent thread"},
+    {"role": "user", "content": "First question"},
+    {"role": "assistant", "content": "First answer"},
+    {"role": "user", "content": "Second question"},
+]
+
+
+class StandIn:
+    """Answers Messages API requests and records their JSON bodies"""
+    
+    def __init__(self):
+        self.requests = []
+    
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body)
+        if body.get("stream"):
+            return httpx.Response(200, text=self._stream(body), headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json={
+            "id": "msg_1",
+            "type": "message",
+            "role": "assistant",
+            "model": body["model"],
+            "content": [{"type": "text", "text": "Hello there"}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": USAGE,
+        })
+    
+    @staticmethod
+    def _stream(body) -> str:
+        events = [
+            ("message_start", {"type": "message_start", "message": {
+                "id": "msg_2", "type": "message", "role": "assistant", "model": body["model"],
+                "content": [], "stop_reason": None, "stop_sequence": None,
+                "usage": {**USAGE, "output_tokens": 1},
+            }}),
+            ("content_block_start", {"type": "content_block_start", "index": 0,
+                                     "content_block": {"type": "text", "text": ""}}),
+            ("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                     "delta": {"type": "text_delta", "text": "Hel"}}),
+            ("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                     "delta": {"type": "text_delta", "text": "lo"}}),
+            ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            ("message_delta", {"type": "message_delta",
+                               "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                               "usage": {"output_tokens": 7}}),
+            ("message_stop", {"type": "message_stop"}),
+        ]
+        return "".join(f"event: {name}\ndata: {json.dumps(data)}\n\n" for name, data in events)
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    monkeypatch.setattr(settings, "anthropic_api_key", "sk-test")
+    monkeypatch.setattr(settings, "anthropic_prompt_caching", True)
+    monkeypatch.setattr(settings, "llm_cache_enabled", False)
+    return StandIn()
+
+
+@pytest.fixture
+def provider(stand_in):
+    provider = AnthropicProvider()
+    provider.http_client = httpx.AsyncClient(transport=httpx.MockTransport(stand_in))
+    provider.client = AsyncAnthropic(api_key="sk-test", base_url="http://stand-in", http_client=provider.http_client)
+    return provider
+
+
+def breakpoints(blocks):
+    return [block.get("cache_control") for block in blocks]
+
+
+def test_send_message_places_cache_breakpoints(provider, stand_in):
+    content, _, _ = asyncio.run(provider.send_message(MESSAGES))
+    
+    assert content == "Hello there"
+    request = stand_in.requests[0]
+    # System prompt and last system block
+    assert breakpoints(request["system"]) == [CACHE_BREAKPOINT, CACHE_BREAKPOINT]
+    # Only the newest message
+    assert [breakpoints(message["content"]) for message in request["messages"]] == [
+        [None], [None], [CACHE_BREAKPOINT]
+    ]
+
+
+def test_send_message_reports_cache_tokens(provider):
+    _, tokens_used, metadata = asyncio.run(provider.send_message(MESSAGES))
+    
+    assert metadata["cache_read_input_tokens"] == 300
+    assert metadata["cache_creation_input_tokens"] == 50
+    # The whole prompt: uncached + cache read + cache write
+    assert metadata["input_tokens"] == 12 + 300 + 50
+    assert metadata["output_tokens"] == 5
+    assert tokens_used == 12 + 300 + 50 + 5
+    assert metadata["anthropic_message_id"] == "msg_1"
+    assert "response_id" not in metadata
+
+
+def test_send_message_without_prompt_caching(provider, stand_in, monkeypatch):
+    monkeypatch.setattr(settings, "anthropic_prompt_caching", False)
+    
+    asyncio.run(provider.send_message(MESSAGES))
+    
+    request = stand_in.requests[0]
+    assert breakpoints(request["system"]) == [None, None]
+    assert all(breakpoints(message["content"]) == [None] for message in request["messages"])
+
+
+def test_send_message_merges_turns_and_starts_with_user(provider, stand_in):
+    asyncio.run(provider.send_message([
+        {"role": "system", "content": "System prompt"},
+        {"role": "assistant", "content": "Answer"},
+        {"role": "user", "content": "Question one"},
+        {"role": "user", "content": "Question two"},
+    ]))
+    
+    messages = stand_in.requests[0]["messages"]
+    assert [message["role"] for message in messages] == ["user", "assistant", "user"]
+    assert messages[0]["content"][0]["text"] == CONTINUATION_PROMPT
+    assert [block["text"] for block in messages[-1]["content"]] == ["Question one", "Question two"]
+    # The breakpoint goes on the last block of the newest message
+    assert breakpoints(messages[-1]["content"]) == [None, CACHE_BREAKPOINT]
+
+
+def test_stream_message(provider, stand_in):
+    async def collect():
+        return [event async for event in provider.stream_message(MESSAGES)]
+    
+    events = asyncio.run(collect())
+    
+    assert [event["text"] for event in events if event["type"] == "delta"] == ["Hel", "lo"]
+    completed = events[-1]
+    assert completed["type"] == "completed"
+    assert completed["content"] == "Hello"
+    # Cache usage comes from message_start, output tokens from message_delta
+    metadata = completed["metadata"]
+    assert metadata["cache_read_input_tokens"] == 300
+    assert metadata["cache_creation_input_tokens"] == 50
+    assert metadata["output_tokens"] == 7
+    assert metadata["streamed"] is True
+    assert completed["tokens_used"] == 12 + 300 + 50 + 7
+    
+    request = stand_in.requests[0]
+    assert request["stream"] is True
+    assert breakpoints(request["system"]) == [CACHE_BREAKPOINT, CACHE_BREAKPOINT]
+    assert breakpoints(request["messages"][-1]["content"]) == [CACHE_BREAKPOINT]
+
+
+def test_summarize(provider, stand_in):
+    summary, tokens_used = asyncio.run(provider.summarize("user: hi\nassistant: hello"))
+    
+    assert summary == "Hello there"
+    assert tokens_used == 12 + 5
+    request = stand_in.requests[0]
+    assert request["model"] == settings.default_anthropic_model
+    assert "user: hi\nassistant: hello" in request["messages"][0]["content"]
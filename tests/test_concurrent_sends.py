@@ -0,0 +1,67 @@
+"""
+Overlapping sends to one thread
+
+While send A waits on the LLM, send B saves its user message in the
+sequence A reserved for its reply. A must then answer 409 and remove its
+user message instead of failing on uq_messages_thread_sequence.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from backend.config import settings
+from backend.database import init_db, close_db
+from backend.main import app
+
+
+@pytest.fixture(autouse=True)
+def fake_provider(monkeypatch):
+    monkeypatch.setattr(settings, "default_provider", "fake")
+    monkeypatch.setattr(settings, "fake_latency_distribution", "fixed")
+    monkeypatch.setattr(settings, "fake_latency_ms", 300.0)
+    monkeypatch.setattr(settings, "fake_failure_rate", 0.0)
+    monkeypatch.setattr(settings, "llm_cache_enabled", False)
+
+
+async def overlapping_sends(stream_first: bool):
+    """Send A, then B while A waits on the LLM; return both responses and the thread's messages"""
+    await init_db()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            thread = (await client.post("/threads", json={})).json()
+            url = f"/threads/{thread['id']}/messages"
+            
+            async def send_b():
+                await asyncio.sleep(0.1)
+                return await client.post(url, json={"content": "B", "provider": "fake"})
+            
+            first, second = await asyncio.gather(
+                client.post(url, json={"content": "A", "provider": "fake", "stream": stream_first}),
+                send_b()
+            )
+            messages = (await client.get(url)).json()["messages"]
+    finally:
+        await close_db()
+    return first, second, [(m["sequence"], m["role"], m["content"]) for m in messages]
+
+
+def test_overlapping_sync_sends():
+    first, second, messages = asyncio.run(overlapping_sends(stream_first=False))
+    
+    assert first.status_code == 409
+    assert second.status_code == 200
+    # A's user message is gone; B's exchange is intact
+    assert [(role, content) for _, role, content in messages] == [("user", "B"), ("assistant", second.json()["content"])]
+
+
+def test_overlapping_stream_and_sync_sends():
+    first, second, messages = asyncio.run(overlapping_sends(stream_first=True))
+    
+    assert first.status_code == 200
+    events = [frame.split("\n")[0] for frame in first.text.strip().split("\n\n")]
+    assert events[-1] == "event: error"
+    assert "modified concurrently" in first.text
+    assert second.status_code == 200
+    assert [(role, content) for _, role, content in messages] == [("user", "B"), ("assistant", second.json()["content"])]
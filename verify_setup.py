@@ -4,6 +4,7 @@ Verification script to check if the Threaded Chat Thought Partner is set up corr
 Run this after setup to verify all components are working.
 """
 
+import asyncio
 import sys
 import os
 from pathlib import Path
@@ -105,11 +106,14 @@ def check_database():
         # Add backend to path
         sys.path.insert(0, str(Path(__file__).parent))
         
-        from backend.database import init_db
+        from backend.database import init_db, close_db
         from backend.models import Thread, Message, ThreadContext
         
         # Try to initialize database
-        init_db()
+        async def initialize():
+            await init_db()
+            await close_db()
+        asyncio.run(initialize())
         
         print("✅ Database initialization successful")
         